@@ -1,6 +1,7 @@
 """The central program that ties all the modules together."""
 
 import time
+import argparse
 from src.modules.bot import Bot
 from src.modules.capture import Capture
 from src.modules.notifier import Notifier
@@ -8,28 +9,43 @@ from src.modules.listener import Listener
 from src.modules.gui import GUI
 
 
-bot = Bot()
-capture = Capture()
-notifier = Notifier()
-listener = Listener()
+# Worker processes import this module as well, and must not start another Auto Maple
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record', help='a directory to record what Auto Maple sees into, '
+                                         "which can also be toggled with 'Record frames'")
+    parser.add_argument('--stats-interval', type=float, default=0,
+                        help="how many seconds apart to report the capture loop's timings")
+    parser.add_argument('--stats-csv',
+                        help='a CSV file to append the timings to instead of printing them')
+    args = parser.parse_args()
 
-bot.start()
-while not bot.ready:
-    time.sleep(0.01)
+    bot = Bot()
+    capture = Capture(stats_interval=args.stats_interval, stats_path=args.stats_csv)
+    notifier = Notifier()
+    listener = Listener()
 
-capture.start()
-while not capture.ready:
-    time.sleep(0.01)
+    bot.start()
+    while not bot.ready:
+        time.sleep(0.01)
 
-notifier.start()
-while not notifier.ready:
-    time.sleep(0.01)
+    capture.start()
+    while not capture.ready:
+        time.sleep(0.01)
 
-listener.start()
-while not listener.ready:
-    time.sleep(0.01)
+    notifier.start()
+    while not notifier.ready:
+        time.sleep(0.01)
 
-print('\n[~] Successfully initialized Auto Maple')
+    listener.start()
+    while not listener.ready:
+        time.sleep(0.01)
 
-gui = GUI()
-gui.start()
+    print('\n[~] Successfully initialized Auto Maple')
+
+    if args.record:
+        capture.start_recording(args.record)
+
+    gui = GUI()
+    gui.start()
+    capture.stop_recording()        # Writes the frames that are still queued
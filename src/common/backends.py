@@ -0,0 +1,354 @@
+"""A collection of frame sources that Capture can take screenshots from."""
+
+import os
+import time
+import ctypes
+import cv2
+import numpy as np
+from src.common.recording import Recording
+try:
+    from ctypes import wintypes
+    user32 = ctypes.windll.user32
+    user32.SetProcessDPIAware()
+    gdi32 = ctypes.windll.gdi32
+    WNDENUMPROC = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+
+    class BITMAPINFOHEADER(ctypes.Structure):
+        _fields_ = [
+            ('biSize', wintypes.DWORD),
+            ('biWidth', wintypes.LONG),
+            ('biHeight', wintypes.LONG),
+            ('biPlanes', wintypes.WORD),
+            ('biBitCount', wintypes.WORD),
+            ('biCompression', wintypes.DWORD),
+            ('biSizeImage', wintypes.DWORD),
+            ('biXPelsPerMeter', wintypes.LONG),
+            ('biYPelsPerMeter', wintypes.LONG),
+            ('biClrUsed', wintypes.DWORD),
+            ('biClrImportant', wintypes.DWORD)
+        ]
+
+    class BITMAPINFO(ctypes.Structure):
+        _fields_ = [
+            ('bmiHeader', BITMAPINFOHEADER),
+            ('bmiColors', wintypes.DWORD * 3)
+        ]
+
+    # Handles are pointer-sized, so their types must be declared on 64-bit Python
+    user32.GetWindowDC.argtypes = [wintypes.HWND]
+    user32.GetWindowDC.restype = wintypes.HDC
+    user32.ReleaseDC.argtypes = [wintypes.HWND, wintypes.HDC]
+    gdi32.CreateCompatibleDC.argtypes = [wintypes.HDC]
+    gdi32.CreateCompatibleDC.restype = wintypes.HDC
+    gdi32.CreateCompatibleBitmap.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int]
+    gdi32.CreateCompatibleBitmap.restype = wintypes.HBITMAP
+    gdi32.SelectObject.argtypes = [wintypes.HDC, wintypes.HGDIOBJ]
+    gdi32.SelectObject.restype = wintypes.HGDIOBJ
+    gdi32.BitBlt.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                             wintypes.HDC, ctypes.c_int, ctypes.c_int, wintypes.DWORD]
+    gdi32.GetDIBits.argtypes = [wintypes.HDC, wintypes.HBITMAP, wintypes.UINT, wintypes.UINT,
+                                ctypes.c_void_p, ctypes.POINTER(BITMAPINFO), wintypes.UINT]
+    gdi32.DeleteObject.argtypes = [wintypes.HGDIOBJ]
+    gdi32.DeleteDC.argtypes = [wintypes.HDC]
+except (AttributeError, ImportError, ValueError):       # Not on Windows, only replays are available
+    user32 = None
+
+SRCCOPY = 0x00CC0020
+DIB_RGB_COLORS = 0
+
+
+class Backend:
+    """
+    Interface for a source of frames. A Backend locates the game window, moves on to
+    a new frame once per iteration of the capture loop, and grabs regions of that frame.
+    """
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        """Acquires any resources needed to grab frames."""
+
+    def close(self):
+        """Releases the resources acquired by open."""
+
+    def find_window(self):
+        """
+        Locates the game window.
+        :return:    The (left, top, right, bottom) bounds of the game window.
+        """
+
+        raise NotImplementedError
+
+    def find_windows(self):
+        """
+        Locates every game window.
+        :return:    A dictionary mapping each window's handle to its bounds.
+        """
+
+        return {0: self.find_window()}
+
+    def advance(self):
+        """
+        Moves on to the next frame.
+        :return:    False if there are no frames left, otherwise True.
+        """
+
+        return True
+
+    def grab(self, region, out=None):
+        """
+        Grabs REGION of the current frame.
+        :param region:  A dictionary with the 'left', 'top', 'width', and 'height' to grab.
+        :param out:     A preallocated BGRA array of REGION's size to write into.
+        :return:        The region as a BGRA Numpy array (OUT if it was provided),
+                        or None if it could not be grabbed.
+        """
+
+        raise NotImplementedError
+
+
+class ScreenBackend(Backend):
+    """
+    Takes screenshots of the live MapleStory window using GDI. Pixels are copied
+    straight into the destination array, so grabbing into a preallocated array
+    does not allocate any memory.
+    """
+
+    WINDOW_NAME = 'MapleStory'
+
+    def __init__(self):
+        self.srcdc = None
+        self.memdc = None
+        self.bitmaps = {}           # Maps (width, height) to a bitmap of that size
+        self.bmi = None
+
+    def open(self):
+        if user32 is None:
+            raise RuntimeError('Screen capture is only supported on Windows, use a replay instead.')
+        self.srcdc = user32.GetWindowDC(0)
+        self.memdc = gdi32.CreateCompatibleDC(self.srcdc)
+        self.bmi = BITMAPINFO()
+        self.bmi.bmiHeader.biSize = ctypes.sizeof(BITMAPINFOHEADER)
+        self.bmi.bmiHeader.biPlanes = 1
+        self.bmi.bmiHeader.biBitCount = 32          # BGRA with one byte per channel
+        self.bmi.bmiHeader.biCompression = 0        # BI_RGB
+
+    def close(self):
+        for bitmap in self.bitmaps.values():
+            gdi32.DeleteObject(bitmap)
+        self.bitmaps = {}
+        if self.memdc is not None:
+            gdi32.DeleteDC(self.memdc)
+            self.memdc = None
+        if self.srcdc is not None:
+            user32.ReleaseDC(0, self.srcdc)
+            self.srcdc = None
+
+    def find_window(self):
+        handle = user32.FindWindowW(None, self.WINDOW_NAME)
+        return self._get_rect(handle)
+
+    def find_windows(self):
+        """Falls back to the result of find_window if no windows are titled WINDOW_NAME."""
+
+        handles = []
+
+        def callback(handle, _):
+            length = user32.GetWindowTextLengthW(handle)
+            title = ctypes.create_unicode_buffer(length + 1)
+            user32.GetWindowTextW(handle, title, length + 1)
+            if title.value == self.WINDOW_NAME and user32.IsWindowVisible(handle):
+                handles.append(handle)
+            return True
+
+        user32.EnumWindows(WNDENUMPROC(callback), 0)
+        if not handles:
+            return super().find_windows()
+        return {h: self._get_rect(h) for h in handles}
+
+    @staticmethod
+    def _get_rect(handle):
+        """Returns the (left, top, right, bottom) bounds of the window with HANDLE."""
+
+        rect = wintypes.RECT()
+        user32.GetWindowRect(handle, ctypes.pointer(rect))
+        rect = (rect.left, rect.top, rect.right, rect.bottom)
+        return tuple(max(0, x) for x in rect)
+
+    def grab(self, region, out=None, delay=1):
+        width, height = region['width'], region['height']
+        if out is None:
+            out = np.empty((height, width, 4), dtype=np.uint8)
+
+        bitmap = self.bitmaps.get((width, height))
+        if bitmap is None:
+            bitmap = gdi32.CreateCompatibleBitmap(self.srcdc, width, height)
+            self.bitmaps[(width, height)] = bitmap
+        gdi32.SelectObject(self.memdc, bitmap)
+        self.bmi.bmiHeader.biWidth = width
+        self.bmi.bmiHeader.biHeight = -height       # Negative for rows ordered from top to bottom
+
+        copied = gdi32.BitBlt(self.memdc, 0, 0, width, height,
+                              self.srcdc, region['left'], region['top'], SRCCOPY)
+        if copied and gdi32.GetDIBits(self.memdc, bitmap, 0, height, out.ctypes.data,
+                                      ctypes.byref(self.bmi), DIB_RGB_COLORS) == height:
+            return out
+        print(f'\n[!] Error while taking screenshot, retrying in {delay} second'
+              + ('s' if delay != 1 else ''))
+        time.sleep(delay)
+
+
+class ReplayBackend(Backend):
+    """
+    Streams previously recorded frames from a directory written by a Recorder, a directory
+    of images, a video file, or a .npy array of shape (frames, height, width, channels).
+    Frames are either replayed as fast as they are consumed, or at the speed they were
+    recorded at.
+    """
+
+    IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp'}
+
+    def __init__(self, path, realtime=False, fps=30, loop=False):
+        """
+        Prepares a replay of the recording at PATH.
+        :param path:        A Recorder's directory, a directory of images, a video, or a .npy file.
+        :param realtime:    Whether to replay at the recorded speed instead of the maximum speed.
+        :param fps:         The recorded frame rate, only used if PATH is a .npy file or images.
+        :param loop:        Whether to restart from the first frame once the replay ends.
+        """
+
+        self.path = path
+        self.realtime = realtime
+        self.fps = fps
+        self.loop = loop
+
+        self.recording = None
+        self.images = None
+        self.array = None
+        self.video = None
+        self.length = 0
+
+        self.index = -1
+        self.frame = None
+        self.finished = False
+        self._start = 0
+
+    def open(self):
+        if Recording.is_recording(self.path):
+            self.recording = Recording(self.path)
+            self.length = len(self.recording)
+        elif os.path.isdir(self.path):
+            self.images = sorted(os.path.join(self.path, f) for f in os.listdir(self.path)
+                                 if os.path.splitext(f)[1].lower() in self.IMAGE_EXTENSIONS)
+            self.length = len(self.images)
+        elif os.path.splitext(self.path)[1].lower() == '.npy':
+            self.array = np.load(self.path, mmap_mode='r')
+            self.length = len(self.array)
+        else:
+            self.video = cv2.VideoCapture(self.path)
+            if not self.video.isOpened():
+                raise ValueError(f"Unable to open recording '{self.path}'")
+            self.fps = self.video.get(cv2.CAP_PROP_FPS) or self.fps
+            self.length = int(self.video.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.length == 0:
+            raise ValueError(f"Recording '{self.path}' does not contain any frames")
+
+        self.index = -1
+        self.frame = None
+        self.finished = False
+        self._start = time.perf_counter()
+
+    def close(self):
+        if self.video is not None:
+            self.video.release()
+            self.video = None
+
+    def find_window(self):
+        if self.frame is None:
+            self.advance()
+        height, width = self.frame.shape[:2]
+        return 0, 0, width, height
+
+    def advance(self):
+        if self.finished:
+            return False
+        if self.realtime:
+            index = self._index_at(time.perf_counter() - self._start)
+        else:
+            index = self.index + 1
+        if index >= self.length:
+            if not self.loop:
+                self.finished = True
+                return False
+            index %= self.length
+            self._start = time.perf_counter() - self._time_of(index)
+        if index != self.index:
+            frame = self._load(index)
+            if frame is None:
+                self.finished = True
+                return False
+            self.frame = frame
+            self.index = index
+        return True
+
+    def grab(self, region, out=None):
+        if self.frame is None:
+            return None
+        left, top = region['left'], region['top']
+        cropped = self.frame[top:top + region['height'], left:left + region['width']]
+        if out is None:
+            return np.ascontiguousarray(cropped)
+        height, width = cropped.shape[:2]
+        if (height, width) != out.shape[:2]:        # REGION extends past the edge of the frame
+            out.fill(0)
+        np.copyto(out[:height, :width], cropped)
+        return out
+
+    def _index_at(self, elapsed):
+        """Returns the index of the frame that was recorded ELAPSED seconds into the recording."""
+
+        if self.recording is not None:
+            index = int(np.searchsorted(self.recording.timestamps, elapsed, side='right')) - 1
+            if elapsed > self.recording.timestamps[-1] + 1 / self.fps:
+                return self.length          # Let the last frame play for one frame before ending
+            return max(0, index)
+        return int(elapsed * self.fps)
+
+    def _time_of(self, index):
+        """Returns how many seconds into the recording the frame at INDEX was recorded."""
+
+        if self.recording is not None:
+            return self.recording.timestamps[index]
+        return index / self.fps
+
+    def _load(self, index):
+        """Reads the frame at INDEX and converts it to BGRA, the format ScreenBackend produces."""
+
+        if self.recording is not None:
+            frame = self.recording.frame(index)
+        elif self.images is not None:
+            frame = cv2.imread(self.images[index], cv2.IMREAD_UNCHANGED)
+        elif self.array is not None:
+            frame = np.asarray(self.array[index])
+        else:
+            if index < self.index:
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                self.index = -1
+            frame = None
+            for _ in range(index - self.index):        # Videos can only be read sequentially
+                success, frame = self.video.read()
+                if not success:
+                    return None
+
+        if frame is None:
+            return None
+        if frame.ndim == 2:
+            return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGRA)
+        if frame.shape[2] == 3:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+        return frame
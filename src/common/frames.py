@@ -0,0 +1,213 @@
+"""Classes used to share captured frames between modules."""
+
+import time
+import cv2
+import threading
+import numpy as np
+
+
+class Frame:
+    """
+    A single preallocated slot in a FrameBuffer. Its image is overwritten once the
+    buffer wraps around, so readers should either finish with a Frame before then,
+    or check that its sequence number has not changed using Frame.valid.
+
+    Converted views of the image (grayscale, HSV, BGR, and downscaled) are computed
+    lazily the first time they are requested, and then shared by every consumer
+    until a new image is written into this slot.
+    """
+
+    def __init__(self, shape, dtype):
+        self.image = np.empty(shape, dtype=dtype)
+        self.seq = 0
+        self.timestamp = 0.0
+        self._views = {}            # Buffers that are reused for every image in this slot
+        self._computed = set()      # The views that are up to date with the current image
+
+    def invalidate(self):
+        """Marks all views as out of date after a new image is written into this slot."""
+
+        self._computed = set()
+
+    @property
+    def gray(self):
+        """The image in grayscale."""
+
+        return self._view('gray', lambda dst: cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY, dst=dst))
+
+    @property
+    def bgr(self):
+        """The image in BGR without an alpha channel."""
+
+        if self.image.ndim == 3 and self.image.shape[2] == 3:
+            return self.image
+        return self._view('bgr', lambda dst: cv2.cvtColor(self.image, cv2.COLOR_BGRA2BGR, dst=dst))
+
+    @property
+    def hsv(self):
+        """The image in HSV."""
+
+        return self._view('hsv', lambda dst: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV, dst=dst))
+
+    def downscaled(self, level):
+        """
+        Returns the grayscale image after halving its resolution LEVEL times.
+        :param level:   The level of the Gaussian pyramid to return, where 0 is the grayscale image.
+        :return:        The downscaled grayscale image.
+        """
+
+        if level <= 0:
+            return self.gray
+        source = self.downscaled(level - 1)
+        return self._view(f'downscaled_{level}', lambda dst: cv2.pyrDown(source, dst=dst))
+
+    def _view(self, name, compute):
+        """Returns the view called NAME, using COMPUTE to update it if it is out of date."""
+
+        if name not in self._computed:
+            self._views[name] = compute(self._views.get(name))
+            self._computed.add(name)
+        return self._views[name]
+
+    def valid(self, seq):
+        """Returns whether this slot still holds the frame that was published as SEQ."""
+
+        return self.seq == seq
+
+    def age(self):
+        """Returns the number of seconds since this frame was captured."""
+
+        return time.perf_counter() - self.timestamp
+
+
+class FrameBuffer:
+    """
+    A ring buffer of preallocated frames with a single writer. Each frame is published
+    with a monotonically increasing sequence number and a capture timestamp, so readers
+    can tell new frames apart from ones they have already processed. Reading the latest
+    frame never blocks; readers may also wait for a frame newer than the last one they saw.
+    """
+
+    def __init__(self, size=8):
+        """
+        Creates an empty FrameBuffer.
+        :param size:    The number of slots to allocate.
+        """
+
+        self.size = size
+        self.seq = 0
+        self.slots = []
+        self._latest = None
+        self._condition = threading.Condition()
+
+    def write(self, image, timestamp=None):
+        """
+        Copies IMAGE into the oldest slot and publishes it.
+        :param image:       The image to publish.
+        :param timestamp:   When IMAGE was captured, defaults to now.
+        :return:            The Frame that IMAGE was published in.
+        """
+
+        frame = self.acquire(image.shape, image.dtype)
+        np.copyto(frame.image, image)
+        return self.publish(frame, timestamp)
+
+    def acquire(self, shape, dtype=np.uint8):
+        """
+        Returns the slot that the next frame will be published in, so that it can be
+        written into directly without an intermediate copy. The slot is invalidated
+        until it is published, and is returned again if it is never published. Slots
+        are reallocated whenever SHAPE or DTYPE changes.
+        :param shape:   The shape of the image that will be written.
+        :param dtype:   The data type of the image that will be written.
+        :return:        The Frame to write into.
+        """
+
+        shape = tuple(shape)
+        if not self.slots or self.slots[0].image.shape != shape \
+                or self.slots[0].image.dtype != dtype:
+            self.slots = [Frame(shape, dtype) for _ in range(self.size)]
+
+        frame = self.slots[(self.seq + 1) % self.size]
+        frame.seq = 0                       # Invalidate the slot while it is being written
+        return frame
+
+    def publish(self, frame, timestamp=None):
+        """
+        Publishes a Frame that was returned by FrameBuffer.acquire once its image has been written.
+        :param frame:       The acquired Frame.
+        :param timestamp:   When the image was captured, defaults to now.
+        :return:            FRAME.
+        """
+
+        seq = self.seq + 1
+        frame.invalidate()
+        frame.timestamp = time.perf_counter() if timestamp is None else timestamp
+        frame.seq = seq
+        self.seq = seq
+        self._latest = frame
+
+        with self._condition:
+            self._condition.notify_all()
+        return frame
+
+    def latest(self):
+        """Returns the most recently published Frame, or None if nothing has been published."""
+
+        return self._latest
+
+    def wait(self, seq=0, timeout=None):
+        """
+        Blocks until a frame newer than SEQ has been published.
+        :param seq:         The sequence number of the last frame that was processed.
+        :param timeout:     The maximum number of seconds to wait for.
+        :return:            The latest Frame, or None if no newer frame arrived in time.
+        """
+
+        def newer():
+            latest = self._latest
+            return latest is not None and latest.seq > seq
+
+        if not newer():
+            with self._condition:
+                self._condition.wait_for(newer, timeout)
+        frame = self._latest
+        if frame is not None and frame.seq > seq:
+            return frame
+
+
+class ChangeDetector:
+    """
+    Cheaply detects whether an image differs from the previous one by only comparing
+    a sparse grid of its pixels.
+    """
+
+    def __init__(self, stride=4):
+        """
+        Creates a ChangeDetector that has not seen any images yet.
+        :param stride:  The distance in pixels between neighbouring samples along each axis.
+        """
+
+        self.stride = stride
+        self.sample = None
+
+    def reset(self):
+        """Forgets the previous image so that the next one is always considered changed."""
+
+        self.sample = None
+
+    def changed(self, image):
+        """
+        Checks whether IMAGE differs from the image that was checked before it.
+        :param image:   The new image.
+        :return:        True if any sampled pixel differs, otherwise False.
+        """
+
+        sample = image[::self.stride, ::self.stride]
+        if self.sample is not None and self.sample.shape == sample.shape:
+            if np.array_equal(sample, self.sample):
+                return False
+            np.copyto(self.sample, sample)
+        else:
+            self.sample = sample.copy()
+        return True
@@ -0,0 +1,243 @@
+"""Classes for recording the frames that Capture sees, and for reading those recordings back."""
+
+import os
+import glob
+import queue
+import threading
+import numpy as np
+
+
+# How many minimaps are compressed together into a single chunk
+MINIMAP_CHUNK_SIZE = 128
+
+# How many full frames are compressed together into a single chunk
+FRAME_CHUNK_SIZE = 8
+
+# How many times per second to record the entire window
+RECORDING_FULL_FRAME_RATE = 1
+
+# How many frames can wait to be written before new ones are dropped
+RECORDING_QUEUE_SIZE = 256
+
+# The directory that recordings started from Auto Maple itself are saved in
+RECORDINGS_DIR = 'recordings'
+
+
+class Recorder:
+    """
+    Appends minimaps and occasional full frames to a directory of compressed chunks.
+    Frames are copied on the caller's thread and compressed and written on a background
+    writer thread, so recording does not slow down the capture loop. If the writer falls
+    too far behind, new frames are dropped instead of blocking the caller.
+
+    Each 'minimap_#####.npz' chunk holds 'images', along with the 'seq', 'timestamp',
+    'offset' of the minimap within the window, 'player_pos', 'rune_active', and
+    'routine_index' of every image. Each 'frame_#####.npz' chunk holds 'images',
+    'seq', and 'timestamp'. All chunks of the same kind contain images of the same shape.
+    """
+
+    def __init__(self, path, full_frame_rate=RECORDING_FULL_FRAME_RATE):
+        """
+        Prepares a Recorder that writes into the directory at PATH.
+        :param path:            The directory to write chunks into, which is created if needed.
+        :param full_frame_rate: How many times per second to record the entire window.
+        """
+
+        self.path = path
+        self.full_frame_rate = full_frame_rate
+        self.recorded = 0
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=RECORDING_QUEUE_SIZE)
+        self._chunks = {'minimap': [], 'frame': []}
+        self._counts = {'minimap': 0, 'frame': 0}
+        self._frame_seq = None
+        self._last_frame = 0
+        self.thread = threading.Thread(target=self._main)
+        self.thread.daemon = True
+
+    def start(self):
+        """Starts this Recorder's writer thread."""
+
+        os.makedirs(self.path, exist_ok=True)
+        print(f"\n[~] Started recording to '{self.path}'")
+        self.thread.start()
+
+    def stop(self):
+        """Writes every remaining frame to disk and stops the writer thread."""
+
+        self._queue.put(None)
+        self.thread.join()
+        print(f"\n[~] Stopped recording, {self.recorded} frames were saved"
+              + (f' and {self.dropped} were dropped' if self.dropped else ''))
+
+    def add_minimap(self, frame, offset, player_pos, rune_active, routine_index):
+        """
+        Queues a minimap to be recorded.
+        :param frame:           The published minimap Frame.
+        :param offset:          The (x, y) position of the minimap within the game window.
+        :param player_pos:      The player's position relative to the minimap.
+        :param rune_active:     Whether there is a rune on the minimap.
+        :param routine_index:   The index of the Component that the routine is currently on.
+        :return:                None
+        """
+
+        self._put('minimap', frame, {
+            'offset': offset,
+            'player_pos': player_pos,
+            'rune_active': rune_active,
+            'routine_index': routine_index
+        })
+
+    def add_frame(self, frame):
+        """
+        Queues FRAME to be recorded if a full frame is due and FRAME has not been recorded yet.
+        :param frame:   The latest published Frame of the entire game window, or None.
+        :return:        None
+        """
+
+        if frame is None or frame.seq == self._frame_seq \
+                or frame.timestamp - self._last_frame < 1 / self.full_frame_rate:
+            return
+        self._frame_seq = frame.seq
+        self._last_frame = frame.timestamp
+        self._put('frame', frame, {})
+
+    def _put(self, kind, frame, data):
+        """Copies FRAME out of its slot and hands it over to the writer thread."""
+
+        data['image'] = frame.image.copy()
+        data['seq'] = frame.seq
+        data['timestamp'] = frame.timestamp
+        try:
+            self._queue.put_nowait((kind, data))
+        except queue.Full:
+            self.dropped += 1
+
+    def _main(self):
+        """Collects queued frames into chunks and writes each chunk once it is full."""
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind, data = item
+            chunk = self._chunks[kind]
+            if chunk and chunk[0]['image'].shape != data['image'].shape:
+                self._flush(kind)
+            chunk.append(data)
+            self.recorded += 1
+            if len(chunk) >= (MINIMAP_CHUNK_SIZE if kind == 'minimap' else FRAME_CHUNK_SIZE):
+                self._flush(kind)
+
+        for kind in self._chunks:
+            self._flush(kind)
+
+    def _flush(self, kind):
+        """Compresses and writes the frames of KIND that have been collected so far."""
+
+        chunk = self._chunks[kind]
+        if not chunk:
+            return
+        arrays = {key: np.array([d[key] for d in chunk]) for key in chunk[0] if key != 'image'}
+        path = os.path.join(self.path, f'{kind}_{self._counts[kind]:05d}.npz')
+        np.savez_compressed(path, images=np.stack([d['image'] for d in chunk]), **arrays)
+        self._counts[kind] += 1
+        self._chunks[kind] = []
+
+
+class Recording:
+    """
+    Reads a directory written by a Recorder. Every minimap is replayed as a full frame
+    by pasting it over the most recent full frame that was recorded before it, so
+    the result can be calibrated and tracked like a live game window.
+    """
+
+    def __init__(self, path):
+        """
+        Indexes the recording at PATH without decompressing any images.
+        :param path:    The directory that was passed to a Recorder.
+        """
+
+        self.path = path
+        self.minimaps = Recording._index(path, 'minimap')
+        self.frames = Recording._index(path, 'frame')
+        if not self.minimaps:
+            raise ValueError(f"Recording '{path}' does not contain any minimaps")
+
+        timestamps = np.concatenate([c['timestamp'] for c in self.minimaps])
+        self.timestamps = timestamps - timestamps[0]
+        self._starts = np.cumsum([0] + [len(c['timestamp']) for c in self.minimaps])
+        self._frame_times = np.concatenate([c['timestamp'] for c in self.frames]) \
+            if self.frames else np.zeros(0)
+        self._frame_starts = np.cumsum([0] + [len(c['timestamp']) for c in self.frames])
+        self._start = timestamps[0]
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @staticmethod
+    def is_recording(path):
+        """Returns whether PATH is a directory written by a Recorder."""
+
+        return os.path.isdir(path) and bool(glob.glob(os.path.join(path, 'minimap_*.npz')))
+
+    @staticmethod
+    def _index(path, kind):
+        """Returns the metadata of every chunk of KIND, in the order they were written."""
+
+        chunks = []
+        for file in sorted(glob.glob(os.path.join(path, f'{kind}_*.npz'))):
+            with np.load(file) as data:
+                metadata = {key: data[key] for key in data.files if key != 'images'}
+            metadata['file'] = file
+            chunks.append(metadata)
+        return chunks
+
+    def metadata(self, index):
+        """Returns a dictionary of everything that was recorded alongside the minimap at INDEX."""
+
+        chunk, i = Recording._locate(self._starts, index)
+        return {key: value[i] for key, value in self.minimaps[chunk].items() if key != 'file'}
+
+    def frame(self, index):
+        """
+        Reconstructs the game window at the time the minimap at INDEX was recorded.
+        :param index:   The index of the minimap to reconstruct.
+        :return:        The game window as a BGRA Numpy array.
+        """
+
+        chunk, i = Recording._locate(self._starts, index)
+        minimap = self._images('minimap', chunk)[i]
+        x, y = self.minimaps[chunk]['offset'][i]
+        height, width = minimap.shape[:2]
+
+        # Start from the latest full frame that was recorded before this minimap
+        timestamp = self._start + self.timestamps[index]
+        latest = np.searchsorted(self._frame_times, timestamp, side='right') - 1
+        if latest >= 0:
+            frame_chunk, j = Recording._locate(self._frame_starts, latest)
+            frame = self._images('frame', frame_chunk)[j].copy()
+        else:
+            frame = np.zeros((y + height, x + width, minimap.shape[2]), dtype=minimap.dtype)
+        frame[y:y + height, x:x + width] = minimap[:frame.shape[0] - y, :frame.shape[1] - x]
+        return frame
+
+    @staticmethod
+    def _locate(starts, index):
+        """Returns the chunk that contains INDEX and the position of INDEX within that chunk."""
+
+        chunk = int(np.searchsorted(starts, index, side='right')) - 1
+        return chunk, index - starts[chunk]
+
+    def _images(self, kind, chunk):
+        """Returns the decompressed images of a chunk, caching the latest chunk of each kind."""
+
+        cached = self._cache.get(kind)
+        if cached is None or cached[0] != chunk:
+            chunks = self.minimaps if kind == 'minimap' else self.frames
+            with np.load(chunks[chunk]['file']) as data:
+                cached = (chunk, data['images'])
+            self._cache[kind] = cached
+        return cached[1]
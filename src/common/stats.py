@@ -0,0 +1,151 @@
+"""Classes for measuring how long each stage of a loop takes."""
+
+import os
+import csv
+import time
+import numpy as np
+
+
+# How many of the most recent samples each histogram keeps
+STATS_WINDOW = 512
+
+# The percentiles that are reported for every stage
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    """A rolling window of the most recent durations of a single stage."""
+
+    def __init__(self, size=STATS_WINDOW):
+        """
+        Creates an empty LatencyHistogram.
+        :param size:    The number of recent samples to keep.
+        """
+
+        self.samples = np.zeros(size, dtype=np.float64)
+        self.count = 0
+
+    def add(self, seconds):
+        """Records a single duration of SECONDS."""
+
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+
+    def summary(self):
+        """
+        Summarizes the samples that are currently in the window.
+        :return:    A dictionary with the total number of samples, along with the mean,
+                    maximum, and each of PERCENTILES in milliseconds. None if it is empty.
+        """
+
+        samples = self.samples[:min(self.count, len(self.samples))] * 1000
+        if len(samples) == 0:
+            return None
+        result = {'count': self.count, 'mean': float(samples.mean()), 'max': float(samples.max())}
+        for p, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES)):
+            result[f'p{p}'] = float(value)
+        return result
+
+
+class LoopStats:
+    """
+    Per-stage latency histograms of a loop, along with the rate at which it iterates.
+    Samples are recorded by the loop's own thread, while any other thread may query them.
+    Optionally prints or appends the summary to a CSV file every few seconds.
+    """
+
+    def __init__(self, name, size=STATS_WINDOW, interval=0, path=None):
+        """
+        Creates a LoopStats without any samples.
+        :param name:        The name of the loop, used when printing.
+        :param size:        The number of recent samples to keep for each stage.
+        :param interval:    How many seconds apart to report the stats, or 0 to never report them.
+        :param path:        A CSV file to append reports to. Reports are printed if this is None.
+        """
+
+        self.name = name
+        self.size = size
+        self.interval = interval
+        self.path = path
+        self.stages = {}
+        self.intervals = LatencyHistogram(size)
+        self._last_tick = None
+        self._last_report = time.perf_counter()
+
+    def record(self, stage, seconds):
+        """Records that STAGE took SECONDS to complete."""
+
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram(self.size)
+        histogram.add(seconds)
+
+    def tick(self, now=None):
+        """
+        Marks the start of an iteration in order to measure the loop's rate,
+        and reports the stats if they are due.
+        :param now:     The time.perf_counter() value at the start of the iteration.
+        :return:        None
+        """
+
+        now = time.perf_counter() if now is None else now
+        if self._last_tick is not None:
+            self.intervals.add(now - self._last_tick)
+        self._last_tick = now
+        if self.interval > 0 and now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report()
+
+    def rate(self):
+        """Returns the number of iterations per second over the recent window."""
+
+        summary = self.intervals.summary()
+        if summary is None or summary['mean'] <= 0:
+            return 0.0
+        return 1000 / summary['mean']
+
+    def snapshot(self):
+        """
+        Summarizes every stage.
+        :return:    A dictionary with the loop's 'rate', and a summary of each stage in 'stages'.
+        """
+
+        stages = {}
+        for stage, histogram in list(self.stages.items()):
+            summary = histogram.summary()
+            if summary is not None:
+                stages[stage] = summary
+        return {'rate': self.rate(), 'stages': stages}
+
+    def format(self):
+        """Returns the current snapshot as a table with one stage per line."""
+
+        snapshot = self.snapshot()
+        lines = [f"{'stage':<10}" + ''.join(f'{f"p{p}":>8}' for p in PERCENTILES)
+                 + f"{'max':>8}"]
+        for stage, summary in snapshot['stages'].items():
+            lines.append(f'{stage:<10}' + ''.join(f"{summary[f'p{p}']:>8.2f}" for p in PERCENTILES)
+                         + f"{summary['max']:>8.2f}")
+        lines.append(f"{snapshot['rate']:.1f} iterations per second, times in ms")
+        return '\n'.join(lines)
+
+    def report(self):
+        """Prints the current snapshot, or appends it to this LoopStats' CSV file."""
+
+        if self.path is None:
+            print(f'\n[~] {self.name} performance:')
+            print('\n'.join(' ~  ' + line for line in self.format().split('\n')))
+            return
+
+        snapshot = self.snapshot()
+        keys = ['mean', *(f'p{p}' for p in PERCENTILES), 'max']
+        new = not os.path.exists(self.path)
+        with open(self.path, 'a', newline='') as file:
+            writer = csv.writer(file)
+            if new:
+                writer.writerow(['time', 'stage', 'count', *keys, 'rate'])
+            now = f'{time.time():.3f}'
+            for stage, summary in snapshot['stages'].items():
+                writer.writerow([now, stage, summary['count'],
+                                 *(f'{summary[k]:.4f}' for k in keys),
+                                 f"{snapshot['rate']:.2f}"])
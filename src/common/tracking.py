@@ -0,0 +1,157 @@
+"""Classes for tracking the player's position on the minimap across frames."""
+
+import time
+import cv2
+
+
+# The furthest (in seconds) past its latest measurement that a PositionEstimator extrapolates
+MAX_EXTRAPOLATION = 0.25
+
+
+class PlayerTracker:
+    """
+    Locates a template on the minimap by only searching a small window around its last
+    known position. Falls back to searching the entire minimap when tracking is lost.
+    """
+
+    def __init__(self, template, threshold=0.8, margin=12):
+        """
+        Creates a PlayerTracker that has not locked onto anything yet.
+        :param template:    The grayscale template to track.
+        :param threshold:   The minimum similarity that counts as a match.
+        :param margin:      How many pixels around the last known position to search.
+        """
+
+        self.template = template
+        self.threshold = threshold
+        self.margin = margin
+        self.position = None
+
+    def reset(self):
+        """Forgets the last known position so that the next search covers the entire minimap."""
+
+        self.position = None
+
+    def locate(self, minimap):
+        """
+        Finds the template within MINIMAP.
+        :param minimap:     The minimap to search, in either BGR(A) or grayscale.
+        :return:            The center of the match in absolute coordinates with sub-pixel
+                            accuracy, or None if it was not found.
+        """
+
+        if self.position is not None:
+            height, width = self.template.shape
+            x = int(round(self.position[0] - width / 2))
+            y = int(round(self.position[1] - height / 2))
+            left = max(0, x - self.margin)
+            top = max(0, y - self.margin)
+            right = min(minimap.shape[1], x + width + self.margin)
+            bottom = min(minimap.shape[0], y + height + self.margin)
+            if right - left >= width and bottom - top >= height:
+                match = self._search(minimap[top:bottom, left:right])
+                if match is not None:
+                    self.position = (match[0] + left, match[1] + top)
+                    return self.position
+
+        # Tracking was lost, search the entire minimap
+        self.position = self._search(minimap)
+        return self.position
+
+    def _search(self, image):
+        """Returns the center of the best match within IMAGE if it exceeds the threshold."""
+
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        result = cv2.matchTemplate(image, self.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (x, y) = cv2.minMaxLoc(result)
+        if score < self.threshold:
+            return None
+        row = result[y, max(0, x - 1):x + 2]
+        column = result[max(0, y - 1):y + 2, x]
+        offset_x = refine_peak(row) if 0 < x < result.shape[1] - 1 else 0
+        offset_y = refine_peak(column) if 0 < y < result.shape[0] - 1 else 0
+        return (x + offset_x + self.template.shape[1] / 2,
+                y + offset_y + self.template.shape[0] / 2)
+
+
+class PositionEstimator:
+    """
+    An alpha-beta filter that smooths noisy position measurements and estimates
+    velocity, which allows it to predict where the player will be in the near future.
+    """
+
+    def __init__(self, alpha=0.6, beta=0.25, max_extrapolation=MAX_EXTRAPOLATION):
+        """
+        Creates a PositionEstimator without any measurements.
+        :param alpha:               How strongly the position follows new measurements, in (0, 1].
+        :param beta:                How strongly the velocity follows new measurements,
+                                    in (0, 4 - 2 * ALPHA).
+        :param max_extrapolation:   How many seconds past the latest measurement to extrapolate
+                                    at most, so that a stale estimate does not keep moving.
+        """
+
+        self.alpha = alpha
+        self.beta = beta
+        self.max_extrapolation = max_extrapolation
+        self.position = None
+        self.velocity = (0.0, 0.0)
+        self.timestamp = None
+
+    def reset(self):
+        """Discards all previous measurements."""
+
+        self.position = None
+        self.velocity = (0.0, 0.0)
+        self.timestamp = None
+
+    def update(self, measurement, timestamp):
+        """
+        Incorporates a new position measurement.
+        :param measurement:     The measured position.
+        :param timestamp:       The time.perf_counter() value at which MEASUREMENT was captured.
+        :return:                The new position estimate.
+        """
+
+        if self.position is None:
+            self.position = tuple(measurement)
+            self.timestamp = timestamp
+            return self.position
+
+        dt = timestamp - self.timestamp
+        if dt <= 0:
+            return self.position
+        predicted = [p + v * dt for p, v in zip(self.position, self.velocity)]
+        residuals = [m - p for m, p in zip(measurement, predicted)]
+        self.position = tuple(p + self.alpha * r for p, r in zip(predicted, residuals))
+        self.velocity = tuple(v + self.beta * r / dt for v, r in zip(self.velocity, residuals))
+        self.timestamp = timestamp
+        return self.position
+
+    def predict(self, t=None):
+        """
+        Predicts the position at time T assuming a constant velocity, up to
+        MAX_EXTRAPOLATION seconds past the latest measurement.
+        :param t:   A time.perf_counter() value, defaults to now.
+        :return:    The predicted position, or None if there have not been any measurements.
+        """
+
+        if self.position is None:
+            return None
+        dt = min((time.perf_counter() if t is None else t) - self.timestamp,
+                 self.max_extrapolation)
+        return tuple(p + v * dt for p, v in zip(self.position, self.velocity))
+
+
+def refine_peak(values):
+    """
+    Fits a parabola through three neighbouring samples around a peak.
+    :param values:  The samples to the left of, at, and to the right of the peak.
+    :return:        The offset of the parabola's vertex from the middle sample, in [-0.5, 0.5].
+    """
+
+    left, center, right = (float(v) for v in values)
+    denominator = left - 2 * center + right
+    if denominator >= 0:        # Not a strict maximum
+        return 0
+    return max(-0.5, min(0.5, 0.5 * (left - right) / denominator))
@@ -6,9 +6,20 @@ import cv2
 import threading
 import numpy as np
 from src.common import config, settings
+from src.common.frames import Frame
 from random import random
 
 
+# The smallest size (in pixels) a template can be downscaled to during pyramid matching
+PYRAMID_MIN_SIZE = 8
+
+# Templates too small for PYRAMID_MIN_SIZE can still be halved once if they stay this large
+PYRAMID_SMALL_MIN_SIZE = 5
+
+# Extra pixels around each coarse match to search at full resolution
+PYRAMID_MARGIN = 2
+
+
 def run_if_enabled(function):
     """
     Decorator for functions that should only run if the bot is enabled.
@@ -72,6 +83,33 @@ def separate_args(arguments):
     return args, kwargs
 
 
+def to_gray(image):
+    """
+    Returns IMAGE in grayscale. If IMAGE is a captured Frame, its cached grayscale view
+    is used so that the conversion happens at most once per frame.
+    :param image:   A BGR(A) or grayscale Numpy array, or a Frame.
+    :return:        The grayscale image.
+    """
+
+    if isinstance(image, Frame):
+        return image.gray
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def to_hsv(image):
+    """
+    Returns IMAGE on the HSV scale, using a Frame's cached HSV view if possible.
+    :param image:   A BGR(A) Numpy array, or a Frame.
+    :return:        The HSV image.
+    """
+
+    if isinstance(image, Frame):
+        return image.hsv
+    return cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+
 def single_match(frame, template):
     """
     Finds the best match within FRAME.
@@ -80,7 +118,7 @@ def single_match(frame, template):
     :return:            The top-left and bottom-right positions of the best match.
     """
 
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    gray = to_gray(frame)
     result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF)
     _, _, _, top_left = cv2.minMaxLoc(result)
     w, h = template.shape[::-1]
@@ -88,54 +126,217 @@ def single_match(frame, template):
     return top_left, bottom_right
 
 
-def multi_match(frame, template, threshold=0.95):
+def multi_match(frame, template, threshold=0.95, max_results=None):
     """
     Finds all matches in FRAME that are similar to TEMPLATE by at least THRESHOLD.
+    Overlapping matches are suppressed so that each object is only found once.
     :param frame:       The image in which to search.
     :param template:    The template to match with.
     :param threshold:   The minimum percentage of TEMPLATE that each result must match.
-    :return:            An array of matches that exceed THRESHOLD.
+    :param max_results: The maximum number of matches to return, defaults to all of them.
+    :return:            An array of matches that exceed THRESHOLD, from most to least similar.
     """
 
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    gray = to_gray(frame)
     result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
-    locations = np.where(result >= threshold)
-    locations = list(zip(*locations[::-1]))
-    results = []
-    for p in locations:
-        x = int(round(p[0] + template.shape[1] / 2))
-        y = int(round(p[1] + template.shape[0] / 2))
-        results.append((x, y))
-    return results
+    xs, ys, scores = _candidates(result, threshold)
+    peaks = _suppress(xs, ys, scores, template.shape[::-1], max_results)
+    return _to_centers(peaks, template)
+
+
+def pyramid_single_match(frame, template, levels=2, candidates=5):
+    """
+    Finds the best match within FRAME using a coarse-to-fine search. Both images are first
+    downscaled LEVELS times to locate a few candidates, and only the regions around those
+    candidates are searched again at full resolution.
+    :param frame:       The image in which to search for TEMPLATE.
+    :param template:    The template to match with.
+    :param levels:      The maximum number of times to halve the resolution of both images.
+    :param candidates:  How many of the best coarse matches to refine.
+    :return:            The top-left and bottom-right positions of the best match.
+    """
+
+    gray = to_gray(frame)
+    coarse, scale = _coarse_match(frame, template, levels)
+    if coarse is None:
+        return single_match(frame, template)
+
+    best_score = None
+    top_left = (0, 0)
+    h, w = template.shape
+    for _ in range(candidates):
+        _, _, _, (x, y) = cv2.minMaxLoc(coarse)
+        left, top, region = _refine_region(gray, template, x * scale, y * scale, scale)
+        result = cv2.matchTemplate(region, template, cv2.TM_CCOEFF)
+        _, score, _, location = cv2.minMaxLoc(result)
+        if best_score is None or score > best_score:
+            best_score = score
+            top_left = (left + location[0], top + location[1])
+
+        # Suppress coarse matches that overlap this one
+        rows, columns = h // scale, w // scale
+        coarse[max(0, y - rows + 1):y + rows, max(0, x - columns + 1):x + columns] = -1
+    w, h = template.shape[::-1]
+    bottom_right = (top_left[0] + w, top_left[1] + h)
+    return top_left, bottom_right
+
+
+def pyramid_multi_match(frame, template, threshold=0.95, levels=2, slack=0.2, max_results=None):
+    """
+    Finds all matches in FRAME that are similar to TEMPLATE by at least THRESHOLD using
+    a coarse-to-fine search. Regions that are similar by at least THRESHOLD - SLACK
+    at the coarse resolution are searched again at full resolution.
+    :param frame:       The image in which to search.
+    :param template:    The template to match with.
+    :param threshold:   The minimum percentage of TEMPLATE that each result must match.
+    :param levels:      The maximum number of times to halve the resolution of both images.
+    :param slack:       How much lower than THRESHOLD a coarse match can be.
+    :param max_results: The maximum number of matches to return, defaults to all of them.
+    :return:            An array of matches that exceed THRESHOLD, from most to least similar.
+    """
+
+    gray = to_gray(frame)
+    coarse, scale = _coarse_match(frame, template, levels)
+    if coarse is None:
+        return multi_match(frame, template, threshold=threshold, max_results=max_results)
+
+    # Only search the regions around coarse matches at full resolution
+    h, w = template.shape
+    xs, ys, scores = _candidates(coarse, threshold - slack)
+    refined = []
+    for x, y in _suppress(xs, ys, scores, (w // scale, h // scale)):
+        left, top, region = _refine_region(gray, template, x * scale, y * scale, scale)
+        result = cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED)
+        refined.append(_candidates(result, threshold, left, top))
+    if not refined:
+        return []
+    xs, ys, scores = (np.concatenate(arrays) for arrays in zip(*refined))
+    peaks = _suppress(xs, ys, scores, (w, h), max_results)
+    return _to_centers(peaks, template)
+
+
+def _coarse_match(frame, template, levels):
+    """
+    Matches downscaled copies of FRAME and TEMPLATE. Stops downscaling before TEMPLATE
+    becomes smaller than PYRAMID_MIN_SIZE pixels along either axis, except that the first
+    level only requires PYRAMID_SMALL_MIN_SIZE pixels so that small templates benefit too.
+    :return:    The normalized match result and the scale factor between it and FRAME,
+                or None and 1 if no downscaling is possible.
+    """
+
+    level = 0
+    for _ in range(levels):
+        if min(template.shape) // 2 < (PYRAMID_MIN_SIZE if level else PYRAMID_SMALL_MIN_SIZE):
+            break
+        template = cv2.pyrDown(template)
+        level += 1
+    if level == 0:
+        return None, 1
+
+    if isinstance(frame, Frame):
+        small = frame.downscaled(level)
+    else:
+        small = to_gray(frame)
+        for _ in range(level):
+            small = cv2.pyrDown(small)
+    if small.shape[0] < template.shape[0] or small.shape[1] < template.shape[1]:
+        return None, 1
+    return cv2.matchTemplate(small, template, cv2.TM_CCOEFF_NORMED), 2 ** level
+
+
+def _candidates(result, threshold, left=0, top=0):
+    """
+    Finds every location in RESULT that is at least THRESHOLD.
+    :param result:      The output of cv2.matchTemplate.
+    :param threshold:   The minimum score of a candidate.
+    :param left:        The horizontal offset of RESULT within the entire frame.
+    :param top:         The vertical offset of RESULT within the entire frame.
+    :return:            Numpy arrays of the candidates' x positions, y positions, and scores.
+    """
+
+    ys, xs = np.nonzero(result >= threshold)
+    return xs + left, ys + top, result[ys, xs]
+
+
+def _suppress(xs, ys, scores, size, limit=None):
+    """
+    Performs non-maximum suppression on a set of candidate matches. Starting from the
+    highest score, keeps each candidate and discards all others that it overlaps with.
+    :param xs:      The candidates' x positions.
+    :param ys:      The candidates' y positions.
+    :param scores:  The candidates' scores.
+    :param size:    The width and height of the matched template.
+    :param limit:   The maximum number of candidates to keep, defaults to all of them.
+    :return:        A list of (x, y) positions of the kept candidates, from highest to lowest score.
+    """
+
+    order = np.argsort(scores, kind='stable')[::-1]
+    xs, ys = xs[order], ys[order]
+    width, height = max(1, size[0]), max(1, size[1])
+    kept = []
+    while len(xs) > 0 and (limit is None or len(kept) < limit):
+        x, y = int(xs[0]), int(ys[0])
+        kept.append((x, y))
+        separate = (np.abs(xs - x) >= width) | (np.abs(ys - y) >= height)
+        xs, ys = xs[separate], ys[separate]
+    return kept
+
+
+def _to_centers(locations, template):
+    """Converts the top-left LOCATIONS of matches into the centers of TEMPLATE."""
+
+    h, w = template.shape
+    return [(int(round(x + w / 2)), int(round(y + h / 2))) for x, y in locations]
+
+
+def _refine_region(gray, template, x, y, scale):
+    """
+    Crops the region of GRAY that may contain TEMPLATE given its approximate
+    top-left corner (X, Y) found at a resolution SCALE times lower.
+    :return:    The left and top offsets of the region, and the region itself.
+    """
+
+    pad = scale + PYRAMID_MARGIN
+    left = max(0, x - pad)
+    top = max(0, y - pad)
+    right = min(gray.shape[1], x + template.shape[1] + pad)
+    bottom = min(gray.shape[0], y + template.shape[0] + pad)
+    return left, top, gray[top:bottom, left:right]
 
 
-def convert_to_relative(point, frame):
+def convert_to_relative(point, frame, ratio=None):
     """
     Converts POINT into relative coordinates in the range [0, 1] based on FRAME.
     Normalizes the units of the vertical axis to equal those of the horizontal
     axis by using config.mm_ratio.
     :param point:   The point in absolute coordinates.
     :param frame:   The image to use as a reference.
+    :param ratio:   The minimap's width to height ratio, defaults to that of the primary window.
     :return:        The given point in relative coordinates.
     """
 
+    if ratio is None:
+        ratio = config.capture.minimap_ratio
     x = point[0] / frame.shape[1]
-    y = point[1] / config.capture.minimap_ratio / frame.shape[0]
+    y = point[1] / ratio / frame.shape[0]
     return x, y
 
 
-def convert_to_absolute(point, frame):
+def convert_to_absolute(point, frame, ratio=None):
     """
     Converts POINT into absolute coordinates (in pixels) based on FRAME.
     Normalizes the units of the vertical axis to equal those of the horizontal
     axis by using config.mm_ratio.
     :param point:   The point in relative coordinates.
     :param frame:   The image to use as a reference.
+    :param ratio:   The minimap's width to height ratio, defaults to that of the primary window.
     :return:        The given point in absolute coordinates.
     """
 
+    if ratio is None:
+        ratio = config.capture.minimap_ratio
     x = int(round(point[0] * frame.shape[1]))
-    y = int(round(point[1] * config.capture.minimap_ratio * frame.shape[0]))
+    y = int(round(point[1] * ratio * frame.shape[0]))
     return x, y
 
 
@@ -143,12 +344,14 @@ def filter_color(img, ranges):
     """
     Returns a filtered copy of IMG that only contains pixels within the given RANGES.
     on the HSV scale.
-    :param img:     The image to filter.
+    :param img:     The image to filter, either a Numpy array or a Frame.
     :param ranges:  A list of tuples, each of which is a pair upper and lower HSV bounds.
     :return:        A filtered copy of IMG.
     """
 
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    hsv = to_hsv(img)
+    if isinstance(img, Frame):
+        img = img.image
     mask = cv2.inRange(hsv, ranges[0][0], ranges[0][1])
     for i in range(1, len(ranges)):
         mask = cv2.bitwise_or(mask, cv2.inRange(hsv, ranges[i][0], ranges[i][1]))
@@ -0,0 +1,149 @@
+"""
+Benchmarks the accuracy and latency of the rune detection pipeline on labelled screenshots.
+Results are written as JSON so that runs before and after a change to the model or its
+preprocessing can be compared with each other.
+"""
+
+import json
+import time
+from src.common.stats import LoopStats
+from src.detection import detection
+from src.detection.dataset import load_labelled
+from src.detection.models import DetectionSettings, create_model
+
+
+# The stages of detect_arrows that are timed, in the order they run
+STAGES = ('filter', 'canny', 'boxes', 'batch', 'upright', 'rotated')
+
+# Metrics that are compared against a baseline run, and whether a higher value is better
+METRICS = {
+    'exact_match': True,
+    'arrow_accuracy': True,
+    'detection_rate': True,
+    'p50': False,
+    'p95': False,
+    'p99': False
+}
+
+
+def run(model, samples, repeat=1):
+    """
+    Runs the detection pipeline on every sample REPEAT times.
+    :param model:       The RuneModel to benchmark.
+    :param samples:     A list of (name, image, arrows) tuples.
+    :param repeat:      How many times to solve each sample, which steadies the percentiles.
+    :return:            A dictionary of the accuracy metrics, the latency of each image and
+                        of each stage, and the prediction for every sample.
+    """
+
+    stats = LoopStats('Rune detection', size=len(samples) * repeat)
+    results = []
+    for name, image, expected in samples:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            arrows = detection.detect_arrows(model, image, stats)
+            stats.record('total', time.perf_counter() - start)
+        predicted = [direction for direction, _ in arrows]
+        results.append({
+            'name': name,
+            'expected': expected,
+            'predicted': predicted,
+            'scores': [round(score, 4) for _, score in arrows],
+            'correct': [p == e for p, e in zip(predicted, expected)] + [False] * (4 - len(arrows))
+        })
+
+    stages = stats.snapshot()['stages']
+    total = len(results)
+    return {
+        'samples': total,
+        'repeat': repeat,
+        'exact_match': sum(all(r['correct']) for r in results) / total,
+        'arrow_accuracy': sum(sum(r['correct']) for r in results) / (4 * total),
+        'detection_rate': sum(len(r['predicted']) == 4 for r in results) / total,
+        'latency': stages.pop('total'),
+        'stages': {stage: stages[stage] for stage in STAGES if stage in stages},
+        'results': results
+    }
+
+
+def compare(report, baseline):
+    """
+    Prints how REPORT differs from BASELINE, another report of the same screenshots.
+    :param report:      The report of the current run.
+    :param baseline:    The report of a previous run.
+    :return:            None
+    """
+
+    print(f"\n[~] Compared to baseline ({baseline['backend']}, "
+          f"{'int8' if baseline['quantized'] else 'float'}):")
+    for metric, higher_is_better in METRICS.items():
+        old = baseline.get(metric, baseline['latency'].get(metric))
+        new = report.get(metric, report['latency'].get(metric))
+        change = new - old
+        better = change > 0 if higher_is_better else change < 0
+        verdict = '' if change == 0 else (' (better)' if better else ' (worse)')
+        print(f' ~  {metric:<16}{old:>10.3f} -> {new:.3f}{verdict}')
+
+    previous = {r['name']: r['predicted'] for r in baseline['results']}
+    changed = [r for r in report['results']
+               if r['name'] in previous and r['predicted'] != previous[r['name']]]
+    for r in changed:
+        print(f" !  {r['name']}: {previous[r['name']]} -> {r['predicted']}, "
+              f"expected {r['expected']}")
+    print(f' ~  {len(changed)} of {len(report["results"])} predictions changed')
+
+
+def print_report(report):
+    """Prints a summary of REPORT."""
+
+    print(f"\n[~] Rune detection on {report['samples']} screenshots "
+          f"({report['backend']}, {'int8' if report['quantized'] else 'float'}, "
+          f"{'batched' if report['batching'] else 'sequential'}):")
+    print(f" ~  Exact match:     {report['exact_match']:.1%}")
+    print(f" ~  Arrow accuracy:  {report['arrow_accuracy']:.1%}")
+    print(f" ~  Detection rate:  {report['detection_rate']:.1%}")
+    print(f"{'stage':<14}{'mean':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+    for stage, summary in [*report['stages'].items(), ('total', report['latency'])]:
+        print(f'{stage:<14}' + ''.join(f'{summary[k]:>8.2f}'
+                                        for k in ('mean', 'p50', 'p95', 'p99', 'max')))
+    print('Times in ms')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', help='a directory of screenshots and their labels.json')
+    parser.add_argument('--backend', help='the inference backend, defaults to the saved setting')
+    parser.add_argument('--int8', action='store_true', help='use the int8 model')
+    parser.add_argument('--batch', action='store_true',
+                        help='pad the upright and rotated rune boxes to squares and batch them')
+    parser.add_argument('--repeat', type=int, default=1, help='how many times to solve each image')
+    parser.add_argument('--output', help='a JSON file to write the report to')
+    parser.add_argument('--baseline', help='a JSON report of a previous run to compare against')
+    args = parser.parse_args()
+
+    samples = load_labelled(args.directory)
+    backend = args.backend or DetectionSettings().config['Backend']
+    start = time.perf_counter()
+    model = create_model(backend, args.int8)
+    model.batching = args.batch
+    detection.warm_up_model(model)
+    load_time = time.perf_counter() - start
+
+    report = {
+        'time': time.time(),
+        'directory': args.directory,
+        'backend': backend,
+        'quantized': args.int8,
+        'load_time': load_time,
+        **run(model, samples, args.repeat)
+    }
+    report['batching'] = model.batching         # Read afterwards in case the model rejected one
+    print_report(report)
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            compare(report, json.load(file))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f'\n[~] Saved report to {args.output}')
@@ -0,0 +1,66 @@
+"""Compares the accuracy and latency of each inference backend on labelled screenshots of runes."""
+
+import time
+from src.common.stats import LatencyHistogram
+from src.detection import detection
+from src.detection.dataset import load_labelled
+from src.detection.models import BACKENDS, create_model
+
+
+def evaluate(model, samples):
+    """
+    Solves every sample with MODEL.
+    :param model:       The RuneModel to evaluate.
+    :param samples:     A list of (name, image, arrows) tuples.
+    :return:            A dictionary mapping each sample's name to the predicted arrows,
+                        and a LatencyHistogram of how long each prediction took.
+    """
+
+    predictions = {}
+    latency = LatencyHistogram(size=len(samples))
+    for name, image, _ in samples:
+        start = time.perf_counter()
+        predictions[name] = [d for d, _ in detection.detect_arrows(model, image)]
+        latency.add(time.perf_counter() - start)
+    return predictions, latency
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', help='a directory of screenshots and their labels.json')
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS),
+                        help='the backends to compare')
+    parser.add_argument('--int8', action='store_true', help='also compare the int8 models')
+    args = parser.parse_args()
+
+    samples = load_labelled(args.directory)
+    labels = {name: arrows for name, _, arrows in samples}
+    variants = [(b, False) for b in args.backends]
+    if args.int8:
+        variants += [(b, True) for b in args.backends if b != 'tensorflow']
+
+    reference = None
+    print(f'\n[~] Comparing inference backends on {len(samples)} screenshots:')
+    print(f"{'backend':<16}{'load (s)':>10}{'accuracy':>10}{'agreement':>11}"
+          f"{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}")
+    for backend, quantized in variants:
+        name = backend + (' int8' if quantized else '')
+        start = time.perf_counter()
+        try:
+            model = create_model(backend, quantized)
+        except (ImportError, OSError, ValueError) as e:
+            print(f'{name:<16} !  Unable to load: {e}')
+            continue
+        detection.warm_up_model(model)
+        load_time = time.perf_counter() - start
+
+        predictions, latency = evaluate(model, samples)
+        if reference is None and backend == 'tensorflow':
+            reference = predictions
+        correct = sum(predictions[n] == labels[n] for n in labels)
+        agreement = '-' if reference is None \
+            else f'{sum(predictions[n] == reference[n] for n in labels) / len(labels):.1%}'
+        summary = latency.summary()
+        print(f"{name:<16}{load_time:>10.2f}{correct / len(labels):>10.1%}{agreement:>11}"
+              f"{summary['p50']:>10.1f}{summary['p95']:>10.1f}{summary['p99']:>10.1f}")
@@ -0,0 +1,70 @@
+"""
+Converts the rune detection SavedModel into the formats used by the CPU inference backends.
+TFLite conversion requires TensorFlow, while ONNX conversion requires the tf2onnx package,
+and int8 quantization of ONNX models requires the onnxruntime package.
+"""
+
+import sys
+import subprocess
+from src.detection.models import model_path
+
+
+# The ONNX operator set that the model is exported with
+ONNX_OPSET = 13
+
+
+def convert_tflite(quantize=False):
+    """
+    Converts the SavedModel to TFLite. The model's post-processing uses a few TensorFlow
+    operations that TFLite does not implement natively, so the result must be run by an
+    interpreter that includes the Flex delegate.
+    :param quantize:    Whether to store the weights as int8.
+    :return:            The path of the converted model.
+    """
+
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(model_path('tensorflow'))
+    converter.target_spec.supported_ops = [
+        tf.lite.OpsSet.TFLITE_BUILTINS,
+        tf.lite.OpsSet.SELECT_TF_OPS
+    ]
+    if quantize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]        # Dynamic range quantization
+    path = model_path('tflite', quantize)
+    with open(path, 'wb') as file:
+        file.write(converter.convert())
+    return path
+
+
+def convert_onnx(quantize=False):
+    """
+    Converts the SavedModel to ONNX.
+    :param quantize:    Whether to also store the weights as int8.
+    :return:            The path of the converted model.
+    """
+
+    path = model_path('onnx')
+    subprocess.run([sys.executable, '-m', 'tf2onnx.convert',
+                    '--saved-model', model_path('tensorflow'),
+                    '--output', path,
+                    '--opset', str(ONNX_OPSET)],
+                   check=True)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        quantized = model_path('onnx', True)
+        quantize_dynamic(path, quantized, weight_type=QuantType.QInt8)
+        return quantized
+    return path
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('format', choices=['tflite', 'onnx'], help='the format to convert to')
+    parser.add_argument('--int8', action='store_true', help='quantize the weights to int8')
+    args = parser.parse_args()
+
+    convert = convert_tflite if args.format == 'tflite' else convert_onnx
+    print(f'\n[~] Converted rune model to {convert(quantize=args.int8)}')
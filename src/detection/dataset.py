@@ -0,0 +1,36 @@
+"""Loads labelled screenshots of runes for evaluating the detection model offline."""
+
+import os
+import json
+import cv2
+
+
+# The file in a dataset's directory that maps each screenshot to its four arrows
+LABELS_FILE = 'labels.json'
+
+# The directions that an arrow can be labelled with
+DIRECTIONS = {'up', 'down', 'left', 'right'}
+
+
+def load_labelled(directory):
+    """
+    Loads every labelled screenshot in DIRECTORY. Its LABELS_FILE should look like:
+        {"rune_001.png": ["up", "left", "left", "down"], ...}
+    :param directory:   The directory containing the screenshots and LABELS_FILE.
+    :return:            A list of (name, image, arrows) tuples, sorted by name.
+    """
+
+    with open(os.path.join(directory, LABELS_FILE), 'r') as file:
+        labels = json.load(file)
+
+    result = []
+    for name in sorted(labels):
+        arrows = labels[name]
+        if len(arrows) != 4 or not set(arrows) <= DIRECTIONS:
+            raise ValueError(f"Invalid label for '{name}', "
+                             f"expected four of: {', '.join(sorted(DIRECTIONS))}")
+        image = cv2.imread(os.path.join(directory, name), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Unable to read screenshot '{name}'")
+        result.append((name, image, arrows))
+    return result
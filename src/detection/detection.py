@@ -1,22 +1,271 @@
-"""A module for classifying directional arrows using TensorFlow."""
+"""A module for classifying directional arrows using TensorFlow, TFLite, or ONNX Runtime."""
 
 import cv2
-import tensorflow as tf
+import time
+import weakref
+import threading
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future
 from src.common import utils
+from src.detection.models import DetectionSettings, create_model, set_cpu_affinity, \
+    VOTE_MARGIN, TIMEOUT_CONFIDENCE
+from src.detection.worker import InferenceWorker
 
 
 #########################
-#       Functions       #
+#       Constants       #
 #########################
-def load_model():
+# The size of the black canvas that the isolated rune box is padded to
+PAD_HEIGHT = 384
+PAD_WIDTH = 455
+
+# The upright and rotated rune boxes are padded to squares of this size to be batched together
+BATCH_SIZE = max(PAD_HEIGHT, PAD_WIDTH)
+
+# The range of HSV colors between orange and green that the arrows are drawn in
+ARROW_LOWER = (1, 100, 100)
+ARROW_UPPER = (75, 255, 255)
+
+# The thresholds used for Canny edge detection
+CANNY_THRESHOLDS = (200, 300)
+
+# The minimum score of a prediction that is considered an arrow
+SCORE_THRESHOLD = 0.5
+
+# Maps each of the model's classes to the direction of the arrow
+ARROW_LABELS = {1: 'up', 2: 'down', 3: 'left', 4: 'right'}
+
+# Vertical arrows in the rotated image are actually horizontal arrows
+ROTATED_LABELS = {1: 'right', 2: 'left'}
+
+# The (height, width) of the game window that the model is warmed up for
+WARMUP_WINDOW = (768, 1366)
+
+# The (width, height) of the grid of cells that a frame's edges are fingerprinted on
+FINGERPRINT_GRID = (64, 32)
+
+# How many recent fingerprints each model remembers the detected arrows of
+INFERENCE_CACHE_SIZE = 16
+
+
+#################################
+#       Classes and Functions   #
+#################################
+def load_model(backend=None, quantized=None, warm_up=True, intra_threads=None,
+               inter_threads=None, affinity=None, memory_growth=None, batching=None):
+    """
+    Loads the rune detection model. Every argument that is None defaults to DetectionSettings.
+    :param backend:         The inference backend to use.
+    :param quantized:       Whether to use the int8 model.
+    :param warm_up:         Whether to run inferences on blank images before returning.
+    :param intra_threads:   How many threads a single operation may use, 0 for every core.
+    :param inter_threads:   How many operations may run at once, 0 for the backend's default.
+    :param affinity:        The cores that this entire process is restricted to, empty for all.
+    :param memory_growth:   Whether TensorFlow allocates GPU memory only as it is needed.
+    :param batching:        Whether to run the upright and rotated inferences in one batch.
+    :return:                The RuneModel object.
+    """
+
+    settings = DetectionSettings()
+
+    def setting(value, key):
+        return settings.config[key] if value is None else value
+
+    affinity = setting(affinity, 'CPU affinity')
+    if affinity:
+        set_cpu_affinity(affinity)
+    model = create_model(setting(backend, 'Backend'), setting(quantized, 'Quantized'),
+                         intra_threads=setting(intra_threads, 'Intra-op threads'),
+                         inter_threads=setting(inter_threads, 'Inter-op threads'),
+                         memory_growth=setting(memory_growth, 'GPU memory growth'))
+    model.batching = setting(batching, 'Batch inferences')
+    if warm_up:
+        warm_up_model(model)
+    return model
+
+
+def load_model_async(worker=None, **kwargs):
+    """
+    Loads and warms up the rune detection model on a background thread, so that the rest
+    of Auto Maple can start without waiting for the inference backend to be imported.
+    :param worker:  Whether to run the model in a separate process, defaults to the
+                    setting in DetectionSettings.
+    :param kwargs:  Keyword arguments that are passed on to load_model.
+    :return:        A Future that resolves to the RuneModel or InferenceWorker object,
+                    either of which can be passed to merge_detection.
+    """
+
+    if worker is None:
+        worker = DetectionSettings().config['Worker process']
+    if not worker:
+        kwargs.setdefault('affinity', [])       # Would also restrict capture and the GUI
+    future = Future()
+
+    def load():
+        try:
+            if worker:
+                model = InferenceWorker(**kwargs)
+                model.start()
+            else:
+                model = load_model(**kwargs)
+            future.set_result(model)
+        except Exception as e:
+            future.set_exception(e)
+
+    thread = threading.Thread(target=load)
+    thread.daemon = True
+    thread.start()
+    return future
+
+
+def warm_up_model(model, window=WARMUP_WINDOW):
+    """
+    Runs an inference on a blank image of every shape that merge_detection uses, so
+    that graph tracing and kernel initialization do not happen while solving a rune.
+    :param model:   The RuneModel to warm up.
+    :param window:  The (height, width) of the game window.
+    :return:        None
+    """
+
+    height, width = window
+    model(crop(np.zeros((height, width, 3), dtype=np.uint8)))
+    square = np.zeros((BATCH_SIZE, BATCH_SIZE, 3), dtype=np.uint8)
+    if model.batch([square, square]) is None:
+        model(np.zeros((PAD_HEIGHT, PAD_WIDTH, 3), dtype=np.uint8))
+        model(np.zeros((PAD_WIDTH, PAD_HEIGHT, 3), dtype=np.uint8))      # The rotated rune box
+
+
+def crop(image):
+    """
+    Crops IMAGE to the area of the game window where the rune's arrows appear.
+    :param image:   The entire game window.
+    :return:        A view of the area around the arrows.
+    """
+
+    height, width = image.shape[:2]
+    return image[120:height//2, width//4:3*width//4]
+
+
+def pad_into(canvas, image):
+    """
+    Centers IMAGE on CANVAS after clearing it, without allocating a new canvas.
+    :param canvas:  The array to draw on.
+    :param image:   The image to pad.
+    :return:        CANVAS, which is left blank if IMAGE does not fit.
+    """
+
+    canvas.fill(0)
+    image_height, image_width = image.shape[:2]
+    x_offset = (canvas.shape[1] - image_width) // 2
+    y_offset = (canvas.shape[0] - image_height) // 2
+    if x_offset >= 0 and y_offset >= 0:
+        canvas[y_offset:y_offset+image_height, x_offset:x_offset+image_width] = image
+    return canvas
+
+
+class Preprocessor:
     """
-    Loads the saved model's weights into an Tensorflow model.
-    :return:    The Tensorflow model object.
+    Isolates the rune's arrows in the same way as crop, filter_color, and canny, but writes
+    every intermediate result into buffers that are reused for each frame. Nothing is
+    allocated once the shape of the frames stops changing. Buffers are shared between
+    calls, so a Preprocessor should only be used by one thread, and each result is only
+    valid until the next call.
     """
 
-    model_dir = f'assets/models/rune_model_rnn_filtered_cannied/saved_model'
-    return tf.saved_model.load(model_dir)
+    def __init__(self):
+        self.buffers = {}
+
+    def buffer(self, name, shape):
+        """Returns the uint8 buffer called NAME, reallocating it if its shape is not SHAPE."""
+
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self.buffers[name] = np.empty(shape, dtype=np.uint8)
+        return buffer
+
+    def edges(self, image, stats=None):
+        """
+        Computes canny(filter_color(crop(IMAGE))).
+        :param image:   The entire game window in BGR or BGRA.
+        :param stats:   A LoopStats to record how long the 'filter' and 'canny' stages take.
+        :return:        The edges of the arrows in BGR.
+        """
+
+        start = time.perf_counter()
+        cropped = crop(image)
+        height, width = cropped.shape[:2]
+        hsv = cv2.cvtColor(cropped, cv2.COLOR_BGR2HSV, dst=self.buffer('hsv', (height, width, 3)))
+        mask = cv2.inRange(hsv, ARROW_LOWER, ARROW_UPPER, dst=self.buffer('mask', (height, width)))
+
+        # Pixels outside of the mask are left untouched, so they must be cleared first
+        filtered = self.buffer('filtered', cropped.shape)
+        filtered.fill(0)
+        cv2.bitwise_and(cropped, cropped, dst=filtered, mask=mask)
+        filtered_time = time.perf_counter()
+
+        edges = cv2.Canny(filtered, *CANNY_THRESHOLDS, edges=self.buffer('edges', (height, width)))
+        cannied = self.buffer('cannied', (height, width, 3))
+        cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR, dst=cannied)
+        if stats is not None:
+            stats.record('filter', filtered_time - start)
+            stats.record('canny', time.perf_counter() - filtered_time)
+        return cannied
+
+    def fingerprint(self):
+        """
+        Computes a perceptual hash of the edges found by the last call to Preprocessor.edges.
+        The edges are divided into a grid of FINGERPRINT_GRID cells, and each bit of the hash
+        is whether its cell contains any edges. Frames whose arrows are unchanged share a
+        fingerprint even if the noise around them differs, as long as it is filtered out.
+        :return:    The fingerprint as bytes, prefixed with the shape of the edges.
+        """
+
+        edges = self.buffers['edges']
+        cells = cv2.resize(edges, FINGERPRINT_GRID, interpolation=cv2.INTER_AREA,
+                           dst=self.buffer('cells', FINGERPRINT_GRID[::-1]))
+        return np.array(edges.shape, dtype=np.uint16).tobytes() + np.packbits(cells > 0).tobytes()
+
+
+class InferenceCache:
+    """A least recently used cache of the arrows detected in frames with each fingerprint."""
+
+    def __init__(self, size=INFERENCE_CACHE_SIZE):
+        """
+        Creates an empty InferenceCache.
+        :param size:    The maximum number of fingerprints to remember.
+        """
+
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint):
+        """Returns the arrows detected in a frame with FINGERPRINT, or None if it is unknown."""
+
+        arrows = self.entries.get(fingerprint)
+        if arrows is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(fingerprint)
+        self.hits += 1
+        return arrows
+
+    def put(self, fingerprint, arrows):
+        """Remembers ARROWS for FINGERPRINT, forgetting the least recently used entry if full."""
+
+        self.entries[fingerprint] = arrows
+        self.entries.move_to_end(fingerprint)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+# Shares its buffers between calls to detect_arrows, which are only made from one thread
+_preprocessor = Preprocessor()
+
+# The InferenceCache of each RuneModel, which is dropped along with its model
+_caches = weakref.WeakKeyDictionary()
 
 
 def canny(image):
@@ -26,7 +275,7 @@ def canny(image):
     :return:        The edges in IMAGE.
     """
 
-    image = cv2.Canny(image, 200, 300)
+    image = cv2.Canny(image, *CANNY_THRESHOLDS)
     colored = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
     return colored
 
@@ -40,7 +289,7 @@ def filter_color(image):
     """
 
     hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    mask = cv2.inRange(hsv, (1, 100, 100), (75, 255, 255))
+    mask = cv2.inRange(hsv, ARROW_LOWER, ARROW_UPPER)
 
     # Mask the image
     color_mask = mask > 0
@@ -49,131 +298,225 @@ def filter_color(image):
     return arrows
 
 
-def run_inference_for_single_image(model, image):
+def top_arrays(output_dict):
     """
-    Performs an inference once.
-    :param model:   The model object to use.
-    :param image:   The input image.
-    :return:        The model's predictions including bounding boxes and classes.
+    Returns the best four classifications out of a single inference's predictions.
+    :param output_dict:     The model's predictions for one image.
+    :return:                The scores, boxes, and classes of up to four predictions as
+                            Numpy arrays, most confident first.
     """
 
-    image = np.asarray(image)
+    scores = output_dict['detection_scores']
+    confident = np.flatnonzero(scores > SCORE_THRESHOLD)
+    order = confident[np.argsort(-scores[confident], kind='stable')[:4]]
+    boxes = output_dict['detection_boxes']
+    classes = output_dict['detection_classes']
+    return scores[order], boxes[order], classes[order]
 
-    input_tensor = tf.convert_to_tensor(image)
-    input_tensor = input_tensor[tf.newaxis,...]
 
-    model_fn = model.signatures['serving_default']
-    output_dict = model_fn(input_tensor)
+@utils.run_if_enabled
+def merge_detection(model, image):
+    """
+    Run two inferences: one on the upright image, and one on the image rotated 90 degrees.
+    Only considers vertical arrows and merges the results of the two inferences together.
+    (Vertical arrows in the rotated image are actually horizontal arrows). If the model's
+    batching is enabled, both images are padded to BATCH_SIZE squares and run in a single
+    batch, otherwise they are run one at a time on their own shapes.
+    :param model:   The RuneModel or InferenceWorker to use.
+    :param image:   The input image.
+    :return:        A list of four arrow directions.
+    """
 
-    num_detections = int(output_dict.pop('num_detections'))
-    output_dict = {key: value[0,:num_detections].numpy() 
-                   for key, value in output_dict.items()}
-    output_dict['num_detections'] = num_detections
-    output_dict['detection_classes'] = output_dict['detection_classes'].astype(np.int64)
-    return output_dict
+    arrows, _ = detect_arrows_cached(model, image)
+    return [direction for direction, _ in arrows]
 
 
-def sort_by_confidence(model, image):
+def detect_arrows_cached(model, image):
     """
-    Runs a single inference on the image and returns the best four classifications.
-    :param model:   The model object to use.
+    Classifies each arrow in the same way as detect_arrows, but skips the inferences if a
+    recent frame had the same fingerprint and returns that frame's arrows instead.
+    :param model:   The RuneModel or InferenceWorker to use.
     :param image:   The input image.
-    :return:        The model's top four predictions.
+    :return:        A list of (direction, score) tuples from left to right, and the
+                    fingerprint of IMAGE, which is None if it could not be solved.
     """
 
-    output_dict = run_inference_for_single_image(model, image)
-    zipped = list(zip(output_dict['detection_scores'],
-                      output_dict['detection_boxes'],
-                      output_dict['detection_classes']))
-    pruned = [t for t in zipped if t[0] > 0.5]
-    pruned.sort(key=lambda x: x[0], reverse=True)
-    result = pruned[:4]
-    return result
+    if isinstance(model, InferenceWorker):
+        return model.detect(image)
 
+    cannied = _preprocessor.edges(image)
+    fingerprint = _preprocessor.fingerprint()
+    cache = _caches.get(model)
+    if cache is None:
+        cache = _caches[model] = InferenceCache()
+    arrows = cache.get(fingerprint)
+    if arrows is None:
+        arrows = read_arrows(model, cannied)
+        cache.put(fingerprint, arrows)
+    return list(arrows), fingerprint
 
-def get_boxes(model, image):
+
+def detect_arrows(model, image, stats=None):
     """
-    Returns the bounding boxes of the top four classified arrows.
-    :param model:   The model object to predict with.
+    Classifies each arrow in the same way as merge_detection, along with the confidence
+    of the inference that each arrow's direction was taken from.
+    :param model:   The RuneModel or InferenceWorker to use.
     :param image:   The input image.
-    :return:        Up to four bounding boxes.
+    :param stats:   A LoopStats to record how long each stage takes: 'filter', 'canny', 'boxes',
+                    and either 'batch' or 'upright' and 'rotated' depending on whether MODEL
+                    batches its inferences. Not recorded when MODEL is an InferenceWorker.
+    :return:        A list of (direction, score) tuples from left to right.
     """
 
-    output_dict = run_inference_for_single_image(model, image)
-    zipped = list(zip(output_dict['detection_scores'],
-                      output_dict['detection_boxes'],
-                      output_dict['detection_classes']))
-    pruned = [t for t in zipped if t[0] > 0.5]
-    pruned.sort(key=lambda x: x[0], reverse=True)
-    pruned = pruned[:4]
-    boxes = [t[1:] for t in pruned]
-    return boxes
+    if isinstance(model, InferenceWorker):
+        return model.solve(image)
+    return read_arrows(model, _preprocessor.edges(image, stats), stats)
 
 
-@utils.run_if_enabled
-def merge_detection(model, image):
+def read_arrows(model, cannied, stats=None):
     """
-    Run two inferences: one on the upright image, and one on the image rotated 90 degrees.
-    Only considers vertical arrows and merges the results of the two inferences together.
-    (Vertical arrows in the rotated image are actually horizontal arrows).
-    :param model:   The model object to use.
-    :param image:   The input image.
-    :return:        A list of four arrow directions.
+    Classifies each arrow in a frame that has already been preprocessed.
+    :param model:       The RuneModel to use.
+    :param cannied:     The edges of the arrows as returned by Preprocessor.edges.
+    :param stats:       A LoopStats to record how long each stage takes, see detect_arrows.
+    :return:            A list of (direction, score) tuples from left to right.
     """
 
-    label_map = {1: 'up', 2: 'down', 3: 'left', 4: 'right'}
-    converter = {'up': 'right', 'down': 'left'}         # For the 'rotated inferences'
-    classes = []
-    
-    # Preprocessing
-    height, width, channels = image.shape
-    cropped = image[120:height//2, width//4:3*width//4]
-    filtered = filter_color(cropped)
-    cannied = canny(filtered)
-
     # Isolate the rune box
-    height, width, channels = cannied.shape
-    boxes = get_boxes(model, cannied)
+    arrows = []
+    height, width = cannied.shape[:2]
+    start = time.perf_counter()
+    _, boxes, _ = top_arrays(model(cannied))
+    if stats is not None:
+        stats.record('boxes', time.perf_counter() - start)
     if len(boxes) == 4:      # Only run further inferences if arrows have been correctly detected
-        y_mins = [b[0][0] for b in boxes]
-        x_mins = [b[0][1] for b in boxes]
-        y_maxes = [b[0][2] for b in boxes]
-        x_maxes = [b[0][3] for b in boxes]
-        left = int(round(min(x_mins) * width))
-        right = int(round(max(x_maxes) * width))
-        top = int(round(min(y_mins) * height))
-        bottom = int(round(max(y_maxes) * height))
+        start = time.perf_counter()
+        top, left = np.round(boxes[:, :2].min(axis=0) * (height, width)).astype(int)
+        bottom, right = np.round(boxes[:, 2:].max(axis=0) * (height, width)).astype(int)
         rune_box = cannied[top:bottom, left:right]
 
         # Pad the rune box with black borders, effectively eliminating the noise around it
-        height, width, channels = rune_box.shape
-        pad_height, pad_width = 384, 455
-        preprocessed = np.full((pad_height, pad_width, channels), (0, 0, 0), dtype=np.uint8)
-        x_offset = (pad_width - width) // 2
-        y_offset = (pad_height - height) // 2
-
-        if x_offset > 0 and y_offset > 0:
-            preprocessed[y_offset:y_offset+height, x_offset:x_offset+width] = rune_box
-
-        # Run detection on preprocessed image
-        lst = sort_by_confidence(model, preprocessed)
-        lst.sort(key=lambda x: x[1][1])
-        classes = [label_map[item[2]] for item in lst]
-
-        # Run detection on rotated image
-        rotated = cv2.rotate(preprocessed, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        lst = sort_by_confidence(model, rotated)
-        lst.sort(key=lambda x: x[1][2], reverse=True)
-        rotated_classes = [converter[label_map[item[2]]]
-                           for item in lst
-                           if item[2] in [1, 2]]
-            
+        upright = _preprocessor.buffer('upright', (PAD_HEIGHT, PAD_WIDTH, 3))
+        preprocessed = pad_into(upright, rune_box)
+        rotated = cv2.rotate(preprocessed, cv2.ROTATE_90_COUNTERCLOCKWISE,
+                             dst=_preprocessor.buffer('rotated', (PAD_WIDTH, PAD_HEIGHT, 3)))
+
+        # Run detection on the upright and rotated images, which must be the same shape to batch
+        results = None
+        if model.batching:
+            batch = _preprocessor.buffer('batch', (2, BATCH_SIZE, BATCH_SIZE, 3))
+            pad_into(batch[0], preprocessed)
+            pad_into(batch[1], rotated)
+            results = model.batch(batch)
+            if results is not None and stats is not None:
+                stats.record('batch', time.perf_counter() - start)
+        if results is not None:
+            upright_dict, rotated_dict = results
+        else:
+            start = time.perf_counter()
+            upright_dict = model(preprocessed)
+            upright_time = time.perf_counter()
+            rotated_dict = model(rotated)
+            if stats is not None:
+                stats.record('upright', upright_time - start)
+                stats.record('rotated', time.perf_counter() - upright_time)
+
+        # Read the upright image's arrows from left to right
+        scores, boxes, classes = top_arrays(upright_dict)
+        order = np.argsort(boxes[:, 1], kind='stable')
+        arrows = [(ARROW_LABELS[c], float(s)) for s, c in zip(scores[order], classes[order])]
+
+        # Read the rotated image's vertical arrows from bottom to top, which are actually horizontal
+        scores, boxes, classes = top_arrays(rotated_dict)
+        vertical = np.flatnonzero(classes <= 2)
+        order = vertical[np.argsort(-boxes[vertical, 2], kind='stable')]
+        rotated_arrows = [(ROTATED_LABELS[c], float(s))
+                          for s, c in zip(scores[order], classes[order])]
+
         # Merge the two detection results
-        for i in range(len(classes)):
-            if rotated_classes and classes[i] in ['left', 'right']:
-                classes[i] = rotated_classes.pop(0)
+        for i in range(len(arrows)):
+            if rotated_arrows and arrows[i][0] in ['left', 'right']:
+                arrows[i] = rotated_arrows.pop(0)
+
+    return arrows
+
+
+class ArrowVoter:
+    """
+    Accumulates the arrows detected across a stream of frames. Each frame votes for one
+    direction at every position, weighted by the confidence of its inference, and the
+    rune is solved once every position's leading direction is ahead by a margin. Frames
+    that look the same as one that already voted add no new evidence and are not counted,
+    so a rune prompt that does not change on screen can only be decided by ArrowVoter.confident.
+    """
 
-    return classes
+    def __init__(self, margin=VOTE_MARGIN):
+        """
+        Creates an ArrowVoter without any votes.
+        :param margin:  How much more weight the leading direction at each position must have
+                        than the runner-up, where a confident inference has a weight close to 1.
+                        The default requires two confident frames that agree.
+        """
+
+        self.margin = margin
+        self.votes = [{} for _ in range(4)]
+        self.best_frame = None
+        self.fingerprints = set()
+        self.inferences = 0
+        self.duplicates = 0
+
+    def add(self, arrows, fingerprint=None):
+        """
+        Adds the votes of a single frame.
+        :param arrows:      A list of (direction, score) tuples as returned by detect_arrows.
+        :param fingerprint: The frame's fingerprint from detect_arrows_cached. A frame that looks
+                            the same as one that already voted is not counted.
+        :return:            Whether ARROWS was counted, which requires all four arrows.
+        """
+
+        if len(arrows) != 4:
+            return False
+        if fingerprint is not None:
+            if fingerprint in self.fingerprints:
+                self.duplicates += 1
+                return False
+            self.fingerprints.add(fingerprint)
+        for votes, (direction, score) in zip(self.votes, arrows):
+            votes[direction] = votes.get(direction, 0) + score
+        lowest = min(score for _, score in arrows)
+        if self.best_frame is None or lowest > min(score for _, score in self.best_frame):
+            self.best_frame = list(arrows)
+        self.inferences += 1
+        return True
+
+    def solution(self):
+        """Returns the four winning directions, or None if any position is not decided yet."""
+
+        if self.inferences == 0:
+            return None
+        result = []
+        for votes in self.votes:
+            ranked = sorted(votes.values(), reverse=True) + [0]
+            if ranked[0] - ranked[1] < self.margin:
+                return None
+            result.append(max(votes, key=votes.get))
+        return result
+
+    def confident(self, threshold=TIMEOUT_CONFIDENCE):
+        """
+        Returns an undecided solution that rests on a single confident frame, which is meant
+        for when time runs out on a rune prompt that did not change between frames.
+        :param threshold:   The lowest score that every arrow of the frame must have.
+        :return:            The four directions of the counted frame whose least confident
+                            arrow scored highest, or None if that score is below THRESHOLD or
+                            any of its arrows is not the leading direction at its position.
+        """
+
+        if self.best_frame is None or min(s for _, s in self.best_frame) < threshold:
+            return None
+        directions = [d for d, _ in self.best_frame]
+        leaders = [max(votes, key=votes.get) for votes in self.votes]
+        return directions if directions == leaders else None
 
 
 # Script for testing the detection module by itself
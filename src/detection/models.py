@@ -0,0 +1,296 @@
+"""Interchangeable inference backends for the rune detection model."""
+
+import os
+import sys
+import ctypes
+import numpy as np
+from src.common.interfaces import Configurable
+
+
+#########################
+#       Constants       #
+#########################
+MODEL_DIR = 'assets/models/rune_model_rnn_filtered_cannied'
+
+# The converted models of each backend, relative to MODEL_DIR
+MODEL_FILES = {
+    'tensorflow': 'saved_model',
+    'tflite': 'model.tflite',
+    'onnx': 'model.onnx'
+}
+
+# Converted models that have been quantized to int8 use this suffix
+QUANTIZED_SUFFIX = '_int8'
+
+# How far ahead the leading direction must be at every position to accept a rune's solution
+VOTE_MARGIN = 1.5
+
+# How many seconds to spend solving a rune before giving up
+SOLVE_TIME_BUDGET = 8
+
+# The lowest score of every arrow in a single frame for it to be entered once time runs out
+TIMEOUT_CONFIDENCE = 0.9
+
+
+#################################
+#       Classes and Functions   #
+#################################
+class RuneModel:
+    """
+    Interface for a backend that runs the rune detection model. Calling a RuneModel runs
+    a single inference, while RuneModel.batch runs inferences on several images of the same
+    shape in one call if the model accepts batches of more than one image. Batching is only
+    used if it is enabled, see the 'Batch inferences' setting of DetectionSettings.
+
+    Every backend returns the same predictions as the original SavedModel: a dictionary
+    of 'detection_boxes', 'detection_scores', 'detection_classes', and 'num_detections'.
+    """
+
+    def __init__(self):
+        self.batching = False           # Disabled again if the model rejects a batch
+        self.batch_errors = (ValueError, RuntimeError)
+
+    def __call__(self, image):
+        """
+        Performs an inference once.
+        :param image:   The input image.
+        :return:        The model's predictions including bounding boxes and classes.
+        """
+
+        return RuneModel._unpack(self._run(np.asarray(image)[np.newaxis, ...]), 0)
+
+    def batch(self, images):
+        """
+        Performs an inference on each of IMAGES using a single call to the model. If the model
+        rejects the batch, batching is disabled and the caller should run its inferences one
+        at a time instead, on whichever shapes it would use without batching.
+        :param images:  A list of input images that all have the same shape, or an array
+                        of images that is used as the batch without copying it.
+        :return:        A list of the model's predictions for each image, or None if batching
+                        is disabled.
+        """
+
+        if not self.batching:
+            return None
+        try:
+            batch = images if isinstance(images, np.ndarray) else np.stack(images)
+            output_dict = self._run(batch)
+            return [RuneModel._unpack(output_dict, i) for i in range(len(images))]
+        except self.batch_errors:
+            self.batching = False
+            print(' !  Rune model does not accept batches, running inferences one at a time')
+            return None
+
+    def _run(self, batch):
+        """
+        Runs the model on BATCH.
+        :param batch:   A uint8 Numpy array of shape (images, height, width, 3).
+        :return:        A dictionary mapping each output's name to a Numpy array.
+        """
+
+        raise NotImplementedError
+
+    @staticmethod
+    def _unpack(output_dict, index):
+        """Returns the predictions for the image at INDEX of a batch."""
+
+        num_detections = int(output_dict['num_detections'][index])
+        result = {key: np.asarray(value[index, :num_detections])
+                  for key, value in output_dict.items() if key != 'num_detections'}
+        result['num_detections'] = num_detections
+        result['detection_classes'] = result['detection_classes'].astype(np.int64)
+        return result
+
+
+class TensorflowModel(RuneModel):
+    """
+    Runs the original SavedModel using TensorFlow, which supports GPUs. TensorFlow only
+    accepts threading and memory settings before its runtime starts, so they are ignored
+    if another model has already been loaded in this process.
+    """
+
+    def __init__(self, path, intra_threads=0, inter_threads=0, memory_growth=True):
+        """
+        Loads the SavedModel at PATH.
+        :param path:            The path to the SavedModel.
+        :param intra_threads:   How many threads a single operation may use, 0 for every core.
+        :param inter_threads:   How many operations may run at once, 0 for TensorFlow's default.
+        :param memory_growth:   Whether to allocate GPU memory as it is needed instead of
+                                reserving almost all of it up front.
+        """
+
+        super().__init__()
+        import tensorflow as tf
+
+        try:
+            if intra_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_threads)
+            if inter_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_threads)
+            if memory_growth:
+                for gpu in tf.config.list_physical_devices('GPU'):
+                    tf.config.experimental.set_memory_growth(gpu, True)
+        except RuntimeError:
+            print(' !  TensorFlow is already running, keeping its thread and memory settings')
+
+        self.tf = tf
+        self.model = tf.saved_model.load(path)
+        self.model_fn = self.model.signatures['serving_default']    # Looked up only once
+        self.batch_errors = (tf.errors.InvalidArgumentError, ValueError)
+
+    def _run(self, batch):
+        output_dict = self.model_fn(self.tf.convert_to_tensor(batch))
+        return {key: value.numpy() for key, value in output_dict.items()}
+
+
+class TFLiteModel(RuneModel):
+    """
+    Runs a TFLite conversion of the model on the CPU. Uses the standalone tflite_runtime
+    package if it is installed and able to run the model, which avoids loading TensorFlow
+    entirely. Models that were converted with TensorFlow operations, such as the ones from
+    convert_tflite, need the Flex delegate in TensorFlow's own interpreter instead.
+    """
+
+    def __init__(self, path, intra_threads=0, inter_threads=0, memory_growth=True):
+        """
+        Loads the TFLite model at PATH. The interpreter runs one operation at a time on the CPU,
+        so INTER_THREADS and MEMORY_GROWTH have no effect.
+        :param path:            The path to the .tflite file.
+        :param intra_threads:   How many threads the interpreter may use, 0 for every core.
+        """
+
+        super().__init__()
+        num_threads = intra_threads or os.cpu_count()
+        try:
+            from tflite_runtime.interpreter import Interpreter
+            self._load(Interpreter, path, num_threads)
+        except (ImportError, RuntimeError, ValueError):
+            # tflite_runtime lacks the Flex delegate needed by models with TensorFlow operations
+            from tensorflow.lite import Interpreter
+            self._load(Interpreter, path, num_threads)
+
+    def _load(self, interpreter, path, num_threads):
+        """Loads the model at PATH using the INTERPRETER class and prepares its signature."""
+
+        self.interpreter = interpreter(model_path=path, num_threads=num_threads)
+        self.runner = self.interpreter.get_signature_runner()
+        self.interpreter.allocate_tensors()             # Fails here if operations are missing
+        inputs = self.interpreter.get_signature_list()['serving_default']['inputs']
+        self.input_name = inputs[0]
+
+    def _run(self, batch):
+        # The signature runner resizes its input whenever the shape of BATCH changes
+        return self.runner(**{self.input_name: batch})
+
+
+class OnnxModel(RuneModel):
+    """Runs an ONNX conversion of the model on the CPU using ONNX Runtime."""
+
+    def __init__(self, path, intra_threads=0, inter_threads=0, memory_growth=True):
+        """
+        Loads the ONNX model at PATH. MEMORY_GROWTH has no effect on the CPU.
+        :param path:            The path to the .onnx file.
+        :param intra_threads:   How many threads a single operation may use, 0 for every core.
+        :param inter_threads:   How many operations may run at once, 0 for the default.
+        """
+
+        super().__init__()
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_threads
+        options.inter_op_num_threads = inter_threads
+        self.session = onnxruntime.InferenceSession(path, sess_options=options,
+                                                    providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [o.name for o in self.session.get_outputs()]
+
+    def _run(self, batch):
+        outputs = self.session.run(self.output_names, {self.input_name: batch})
+        return {name.split(':')[0]: value for name, value in zip(self.output_names, outputs)}
+
+
+# Maps the name of each backend to the RuneModel that implements it
+BACKENDS = {
+    'tensorflow': TensorflowModel,
+    'tflite': TFLiteModel,
+    'onnx': OnnxModel
+}
+
+
+def model_path(backend, quantized=False):
+    """
+    Returns where the model for BACKEND is stored.
+    :param backend:     The name of the backend.
+    :param quantized:   Whether to use the int8 version of the converted model.
+    :return:            The path to the model.
+    """
+
+    name = MODEL_FILES[backend]
+    if quantized and backend != 'tensorflow':
+        root, extension = os.path.splitext(name)
+        name = root + QUANTIZED_SUFFIX + extension
+    return os.path.join(MODEL_DIR, name)
+
+
+def create_model(backend, quantized=False, **options):
+    """
+    Loads the rune detection model using BACKEND.
+    :param backend:     The name of the backend, one of BACKENDS.
+    :param quantized:   Whether to use the int8 version of the converted model.
+    :param options:     The INTRA_THREADS, INTER_THREADS, and MEMORY_GROWTH of the backend.
+    :return:            The RuneModel object.
+    """
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', "
+                         f"expected one of: {', '.join(BACKENDS)}")
+    return BACKENDS[backend](model_path(backend, quantized), **options)
+
+
+def set_cpu_affinity(cores):
+    """
+    Restricts every thread of the current process to CORES.
+    :param cores:   The indices of the logical cores to run on, or an empty list for every core.
+    :return:        None
+    """
+
+    cores = list(cores) or list(range(os.cpu_count()))
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    elif sys.platform == 'win32':
+        kernel32 = ctypes.windll.kernel32
+        kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+        kernel32.SetProcessAffinityMask.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        mask = sum(1 << core for core in cores)
+        if not kernel32.SetProcessAffinityMask(kernel32.GetCurrentProcess(), mask):
+            raise ctypes.WinError()
+
+
+class DetectionSettings(Configurable):
+    """
+    Stores which backend to run the rune detection model with, in which process,
+    and how many of the machine's cores it may use.
+    """
+
+    DEFAULT_CONFIG = {
+        'Backend': 'tensorflow',
+        'Quantized': False,
+        'Worker process': True,
+        'Vote margin': VOTE_MARGIN,
+        'Solve time budget': SOLVE_TIME_BUDGET,
+        'Solve on timeout': True,       # Enter a single confident frame, see ArrowVoter.confident
+        'Timeout confidence': TIMEOUT_CONFIDENCE,
+        'Intra-op threads': 0,          # 0 lets the backend use every core
+        'Inter-op threads': 0,
+        'CPU affinity': [],             # The cores the worker process may run on, empty for all
+        'GPU memory growth': True,
+        'Batch inferences': False       # Pads both rune boxes to squares, see merge_detection
+    }
+
+    def __init__(self):
+        super().__init__('detection')
+
+    def load_config(self):
+        super().load_config()
+        self.config = {**self.DEFAULT_CONFIG, **self.config}    # Fill in settings added later
@@ -0,0 +1,141 @@
+"""
+Measures how each threading configuration of the rune detection model trades solve latency
+against the frame rate of Capture, which competes with the model for the same cores.
+"""
+
+import os
+import time
+import cv2
+from src.common.stats import LatencyHistogram, LoopStats
+from src.detection.worker import InferenceWorker
+from src.modules.capture import Capture
+from src.common.backends import ReplayBackend
+
+
+# How many seconds each configuration is measured for
+TUNING_DURATION = 10
+
+
+def default_configurations():
+    """
+    Returns a few sensible configurations for this machine, starting with the backend's defaults.
+    :return:    A list of (intra-op threads, inter-op threads, cores) tuples.
+    """
+
+    count = os.cpu_count()
+    half = max(1, count // 2)
+    return [
+        (0, 0, []),
+        (1, 1, []),
+        (2, 1, []),
+        (half, 1, []),
+        (half, 1, list(range(count - half, count)))       # Leaves the first cores to Capture
+    ]
+
+
+def parse_configuration(text):
+    """
+    Parses a configuration written as INTRA/INTER or INTRA/INTER/CORES, such as '2/1/2,3'.
+    :param text:    The configuration to parse.
+    :return:        An (intra-op threads, inter-op threads, cores) tuple.
+    """
+
+    parts = text.split('/')
+    if len(parts) not in (2, 3):
+        raise ValueError(f"Invalid configuration '{text}', expected INTRA/INTER[/CORES]")
+    cores = [int(c) for c in parts[2].split(',')] if len(parts) == 3 and parts[2] else []
+    return int(parts[0]), int(parts[1]), cores
+
+
+def describe(configuration):
+    """Returns a short description of CONFIGURATION for printing."""
+
+    if configuration is None:
+        return 'capture only'
+    intra, inter, cores = configuration
+    return f"{intra or 'all'}/{inter or 'default'}/{','.join(map(str, cores)) or 'all'}"
+
+
+def measure(capture, image, configuration, backend=None, quantized=None,
+            duration=TUNING_DURATION):
+    """
+    Solves IMAGE in a worker process that uses CONFIGURATION for DURATION seconds
+    while CAPTURE keeps running.
+    :param capture:         A running Capture object.
+    :param image:           A screenshot of the game window that contains a rune.
+    :param configuration:   An (intra-op threads, inter-op threads, cores) tuple,
+                            or None to measure Capture by itself.
+    :param backend:         The inference backend to use.
+    :param quantized:       Whether to use the int8 model.
+    :param duration:        How many seconds to measure for.
+    :return:                A summary of the solve latency, or None if nothing was solved,
+                            and a snapshot of Capture's stats.
+    """
+
+    worker = None
+    if configuration is not None:
+        intra, inter, cores = configuration
+        worker = InferenceWorker(backend, quantized, intra_threads=intra,
+                                 inter_threads=inter, affinity=cores)
+        worker.start()
+        worker.solve(image)         # The first solve sets up the shared memory
+
+    latency = LatencyHistogram()
+    capture.stats = LoopStats('Capture')        # Only measure while this configuration runs
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        if worker is None:
+            time.sleep(end - time.perf_counter())
+        else:
+            start = time.perf_counter()
+            worker.solve(image)
+            latency.add(time.perf_counter() - start)
+    snapshot = capture.stats.snapshot()
+    if worker is not None:
+        worker.stop()
+    return latency.summary(), snapshot
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recording', help='a recording for Capture to replay, see ReplayBackend')
+    parser.add_argument('screenshot', help='a screenshot of the game window containing a rune')
+    parser.add_argument('--configs', nargs='+', type=parse_configuration,
+                        help='configurations written as INTRA/INTER[/CORES], where 0 is the '
+                             "backend's default and CORES is a comma-separated list")
+    parser.add_argument('--backend', help='the inference backend, defaults to the saved setting')
+    parser.add_argument('--int8', action='store_true', help='use the int8 model')
+    parser.add_argument('--fps', type=float, default=float('inf'),
+                        help='the frame rate that Capture is asked for, unlimited by default')
+    parser.add_argument('--duration', type=float, default=TUNING_DURATION,
+                        help='how many seconds to measure each configuration for')
+    args = parser.parse_args()
+
+    screenshot = cv2.imread(args.screenshot, cv2.IMREAD_COLOR)
+    if screenshot is None:
+        parser.error(f"unable to read screenshot '{args.screenshot}'")
+    configurations = args.configs or default_configurations()
+
+    capture = Capture(ReplayBackend(args.recording, loop=True))
+    capture.request_rate('tuning', args.fps, paused=True)
+    capture.start()
+    while not capture.ready:
+        time.sleep(0.01)
+
+    print(f'\n[~] Measuring {len(configurations)} configurations on {os.cpu_count()} cores '
+          f'for {args.duration:g} seconds each:')
+    print(f"{'intra/inter/cores':<24}{'solve p50':>10}{'solve p95':>10}"
+          f"{'capture FPS':>13}{'iteration p95':>15}")
+    for configuration in [None, *configurations]:
+        try:
+            solve, snapshot = measure(capture, screenshot, configuration, backend=args.backend,
+                                      quantized=args.int8 or None, duration=args.duration)
+        except RuntimeError as e:
+            print(f'{describe(configuration):<24} !  Unable to start worker: {e}')
+            continue
+        solve = ('-', '-') if solve is None else (f"{solve['p50']:.1f}", f"{solve['p95']:.1f}")
+        iteration = snapshot['stages'].get('iteration', {}).get('p95', 0)
+        print(f'{describe(configuration):<24}{solve[0]:>10}{solve[1]:>10}'
+              f"{snapshot['rate']:>13.1f}{iteration:>15.2f}")
+    print('Times in ms')
@@ -0,0 +1,204 @@
+"""Runs the rune detection model in a separate process so that it never holds this process' GIL."""
+
+import time
+import queue
+import traceback
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+
+# How many seconds the worker may take to load and warm up its model
+WORKER_START_TIMEOUT = 180
+
+# How many seconds a single request may take before the worker is considered stuck
+WORKER_REQUEST_TIMEOUT = 10
+
+# How often to check whether the worker is still alive while waiting for it, in seconds
+WORKER_POLL_INTERVAL = 0.1
+
+
+class InferenceWorker:
+    """
+    A separate process that holds the rune detection model and runs detect_arrows on
+    frames sent to it. Frames are copied into a shared memory block, and only small messages
+    go through the request and response queues. The worker is restarted automatically if it
+    crashes or stops responding. Only one request is handled at a time.
+    """
+
+    def __init__(self, backend=None, quantized=None, **options):
+        """
+        Prepares an InferenceWorker without starting it.
+        :param backend:     The inference backend to use, defaults to the one in DetectionSettings.
+        :param quantized:   Whether to use the int8 model, defaults to the one in DetectionSettings.
+        :param options:     Keyword arguments that are passed on to load_model, such as the
+                            threads and cores that the worker process may use.
+        """
+
+        self.backend = backend
+        self.quantized = quantized
+        self.options = options
+        self.context = mp.get_context('spawn')      # Forking would copy this process' threads
+        self.process = None
+        self.requests = None
+        self.responses = None
+        self.memory = None
+        self.request_id = 0
+
+    def start(self, timeout=WORKER_START_TIMEOUT):
+        """
+        Starts the worker process and waits until its model is ready.
+        :param timeout:     The maximum number of seconds to wait for.
+        :return:            None
+        """
+
+        self.requests = self.context.Queue()
+        self.responses = self.context.Queue()
+        self.process = self.context.Process(target=_serve,
+                                            args=(self.requests, self.responses,
+                                                  self.backend, self.quantized, self.options))
+        self.process.daemon = True
+        self.process.start()
+
+        deadline = time.perf_counter() + timeout
+        while True:
+            response = self._receive(deadline)
+            if response is None:
+                self.stop()
+                raise RuntimeError('Inference worker did not start in time')
+            status, message = response
+            if status == 'ready':
+                return
+            if status == 'error':
+                self.stop()
+                raise RuntimeError(message)
+
+    def stop(self):
+        """Stops the worker process and releases the shared memory."""
+
+        if self.process is not None:
+            if self.process.is_alive():
+                self.requests.put(None)
+                self.process.join(1)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            self.process = None
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def solve(self, image, timeout=WORKER_REQUEST_TIMEOUT):
+        """
+        Runs detect_arrows on IMAGE in the worker process.
+        :param image:       The entire game window.
+        :param timeout:     The maximum number of seconds to wait for a response.
+        :return:            A list of (direction, score) tuples, empty if the worker failed.
+        """
+
+        arrows, _ = self._request(image, False, timeout)
+        return arrows
+
+    def detect(self, image, timeout=WORKER_REQUEST_TIMEOUT):
+        """
+        Runs detect_arrows_cached on IMAGE in the worker process.
+        :param image:       The entire game window.
+        :param timeout:     The maximum number of seconds to wait for a response.
+        :return:            A list of (direction, score) tuples and the fingerprint of IMAGE,
+                            which are empty and None if the worker failed.
+        """
+
+        return self._request(image, True, timeout)
+
+    def _request(self, image, cached, timeout):
+        """Sends IMAGE to the worker process and returns its arrows and fingerprint."""
+
+        if self.process is None or not self.process.is_alive():
+            if not self._restart('stopped unexpectedly'):
+                return [], None
+
+        # Copy IMAGE into shared memory, growing the block if IMAGE does not fit
+        if self.memory is None or self.memory.size < image.nbytes:
+            if self.memory is not None:
+                self.memory.close()
+                self.memory.unlink()
+            self.memory = shared_memory.SharedMemory(create=True, size=image.nbytes)
+        shared = np.ndarray(image.shape, dtype=np.uint8, buffer=self.memory.buf)
+        np.copyto(shared, image)
+
+        self.request_id += 1
+        self.requests.put((self.request_id, self.memory.name, image.shape, cached))
+        deadline = time.perf_counter() + timeout
+        while True:
+            response = self._receive(deadline)
+            if response is None:
+                self._restart('stopped responding' if self.process.is_alive() else 'crashed')
+                return [], None
+            request_id, arrows, fingerprint = response
+            if request_id == self.request_id:       # Ignore responses to abandoned requests
+                return arrows, fingerprint
+
+    def _restart(self, reason):
+        """
+        Restarts the worker process without raising if it fails to start again, in which
+        case the next request tries once more.
+        :param reason:  Why the worker is being restarted, used when printing.
+        :return:        Whether the worker was restarted successfully.
+        """
+
+        print(f'\n[!] Inference worker {reason}, restarting')
+        self.stop()
+        try:
+            self.start()
+            return True
+        except Exception as e:
+            print(f' !  Unable to restart inference worker: {e}')
+            return False
+
+    def _receive(self, deadline):
+        """Returns the next response, or None if the worker died or DEADLINE passed first."""
+
+        while time.perf_counter() < deadline:
+            try:
+                return self.responses.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    return None
+        return None
+
+
+def _serve(requests, responses, backend, quantized, options):
+    """The main loop of the worker process."""
+
+    from src.detection import detection
+
+    try:
+        model = detection.load_model(backend=backend, quantized=quantized, **options)
+    except Exception:
+        responses.put(('error', traceback.format_exc()))
+        return
+    responses.put(('ready', None))
+
+    memory = None
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, name, shape, cached = request
+        if memory is None or memory.name != name:
+            if memory is not None:
+                memory.close()
+            memory = shared_memory.SharedMemory(name=name)
+        image = np.ndarray(shape, dtype=np.uint8, buffer=memory.buf)
+        try:
+            if cached:
+                arrows, fingerprint = detection.detect_arrows_cached(model, image)
+            else:
+                arrows, fingerprint = detection.detect_arrows(model, image), None
+        except Exception:
+            traceback.print_exc()
+            arrows, fingerprint = [], None
+        responses.put((request_id, arrows, fingerprint))
+    if memory is not None:
+        memory.close()
@@ -3,6 +3,7 @@
 import tkinter as tk
 from src.gui.view.details import Details
 from src.gui.view.minimap import Minimap
+from src.gui.view.performance import Performance
 from src.gui.view.routine import Routine
 from src.gui.view.status import Status
 from src.gui.interfaces import Tab
@@ -24,5 +25,8 @@ class View(Tab):
         self.details = Details(self)
         self.details.grid(row=2, column=2, sticky=tk.NSEW, padx=10, pady=10)
 
+        self.performance = Performance(self)
+        self.performance.grid(row=3, column=1, columnspan=2, sticky=tk.NSEW, padx=10, pady=(0, 10))
+
         self.routine = Routine(self)
         self.routine.grid(row=0, column=1, rowspan=3, sticky=tk.NSEW, padx=10, pady=10)
@@ -17,6 +17,8 @@ class Minimap(LabelFrame):
                                 borderwidth=0, highlightthickness=0)
         self.canvas.pack(expand=True, fill='both', padx=5, pady=5)
         self.container = None
+        self._base = None           # The resized minimap, reused until a new one is captured
+        self._base_seq = None
 
     def display_minimap(self):
         """Updates the Main page with the current minimap."""
@@ -28,15 +30,19 @@ class Minimap(LabelFrame):
             path = minimap['path']
             player_pos = minimap['player_pos']
 
-            img = cv2.cvtColor(minimap['minimap'], cv2.COLOR_BGR2RGB)
-            height, width, _ = img.shape
+            if minimap['seq'] != self._base_seq:
+                img = cv2.cvtColor(minimap['minimap'], cv2.COLOR_BGR2RGB)
+                height, width, _ = img.shape
 
-            # Resize minimap to fit the Canvas
-            ratio = min(self.WIDTH / width, self.HEIGHT / height)
-            new_width = int(width * ratio)
-            new_height = int(height * ratio)
-            if new_height * new_width > 0:
-                img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+                # Resize minimap to fit the Canvas
+                ratio = min(self.WIDTH / width, self.HEIGHT / height)
+                new_width = int(width * ratio)
+                new_height = int(height * ratio)
+                if new_height * new_width > 0:
+                    img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+                self._base = img
+                self._base_seq = minimap['seq']
+            img = self._base.copy()
 
             # Mark the position of the active rune
             if rune_active:
@@ -0,0 +1,20 @@
+import tkinter as tk
+from src.gui.interfaces import LabelFrame
+from src.common import config
+
+
+class Performance(LabelFrame):
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, 'Performance', **kwargs)
+
+        self.stats_var = tk.StringVar()
+        self.stats = tk.Label(self, textvariable=self.stats_var,
+                              font=('Courier', 8), justify=tk.LEFT, anchor=tk.W)
+        self.stats.pack(expand=True, fill='both', padx=5, pady=5)
+
+    def update_stats(self):
+        """Shows the latest per-stage timings of the capture loop."""
+
+        capture = config.capture
+        if capture is not None:
+            self.stats_var.set(capture.stats.format())
@@ -10,6 +10,7 @@ import traceback
 from os.path import splitext, basename
 from src.common import config, utils
 from src.detection import detection
+from src.detection.models import DetectionSettings
 from src.routine import components
 from src.routine.routine import Routine
 from src.routine.components import Point
@@ -28,6 +29,7 @@ class Bot(Configurable):
         'Interact': 'y',
         'Feed pet': '9'
     }
+    FRAME_RATE = 60         # Frames per second needed to track the player while moving
 
     def __init__(self):
         """Loads a user-defined routine on start up and initializes this Bot's main thread."""
@@ -69,12 +71,13 @@ class Bot(Configurable):
         :return:    None
         """
 
-        print('\n[~] Initializing detection algorithm:\n')
-        model = detection.load_model()
-        print('\n[~] Initialized detection algorithm')
+        print('\n[~] Initializing detection algorithm in the background')
+        model = detection.load_model_async()
+        model.add_done_callback(Bot._report_model)
 
         self.ready = True
         config.listener.enabled = True
+        config.capture.request_rate('bot', Bot.FRAME_RATE)
         last_fed = time.time()
         while True:
             if config.enabled and len(config.routine) > 0:
@@ -102,15 +105,30 @@ class Bot(Configurable):
             else:
                 time.sleep(0.01)
 
+    @staticmethod
+    def _report_model(future):
+        """Announces whether the detection algorithm finished loading successfully."""
+
+        if future.exception() is None:
+            print('\n[~] Initialized detection algorithm')
+        else:
+            print(f'\n[!] Unable to initialize detection algorithm: {future.exception()}')
+
     @utils.run_if_enabled
     def _solve_rune(self, model):
         """
         Moves to the position of the rune and solves the arrow-key puzzle.
-        :param model:   The TensorFlow model to classify with.
-        :param sct:     The mss instance object with which to take screenshots.
+        :param model:   A Future of the RuneModel to classify with.
         :return:        None
         """
 
+        # Only wait for the detection algorithm if it has not finished loading yet
+        if not model.done():
+            print('\n[~] Waiting for detection algorithm to finish initializing')
+        if model.exception() is not None:
+            return
+        model = model.result()
+
         move = self.command_book['move']
         move(*self.rune_pos).execute()
         adjust = self.command_book['adjust']
@@ -118,35 +136,58 @@ class Bot(Configurable):
         time.sleep(0.2)
         press(self.config['Interact'], 1, down_time=0.2)        # Inherited from Configurable
 
+        # Vote on each arrow across new frames until every arrow is decided or time runs out
         print('\nSolving rune:')
-        inferences = []
-        for _ in range(15):
-            frame = config.capture.frame
-            solution = detection.merge_detection(model, frame)
+        settings = DetectionSettings().config
+        voter = detection.ArrowVoter(margin=settings['Vote margin'])
+        deadline = time.perf_counter() + settings['Solve time budget']
+        seq = 0
+        solution = None
+        while config.enabled and time.perf_counter() < deadline:
+            latest = config.capture.frames.wait(seq, timeout=1)
+            if latest is None:
+                continue
+            seq = latest.seq
+            arrows, fingerprint = detection.detect_arrows_cached(model, latest.image)
+            if not voter.add(arrows, fingerprint):
+                continue
+            print(', '.join(f'{d} ({s:.2f})' for d, s in arrows))
+            solution = voter.solution()
             if solution:
-                print(', '.join(solution))
-                if solution in inferences:
-                    print('Solution found, entering result')
-                    for arrow in solution:
-                        press(arrow, 1, down_time=0.1)
-                    time.sleep(1)
-                    for _ in range(3):
-                        time.sleep(0.3)
-                        frame = config.capture.frame
-                        rune_buff = utils.multi_match(frame[:frame.shape[0] // 8, :],
-                                                      RUNE_BUFF_TEMPLATE,
-                                                      threshold=0.9)
-                        if rune_buff:
-                            rune_buff_pos = min(rune_buff, key=lambda p: p[0])
-                            target = (
-                                round(rune_buff_pos[0] + config.capture.window['left']),
-                                round(rune_buff_pos[1] + config.capture.window['top'])
-                            )
-                            click(target, button='right')
-                    self.rune_active = False
-                    break
-                elif len(solution) == 4:
-                    inferences.append(solution)
+                print(f'Solution found after {voter.inferences} inferences '
+                      f'({voter.duplicates} repeated frames), entering result')
+                break
+        if not config.enabled:
+            return
+
+        # Out of time, which happens when the prompt does not change between frames
+        if solution is None:
+            if settings['Solve on timeout']:
+                solution = voter.confident(settings['Timeout confidence'])
+            if solution is None:
+                print(f'Unable to solve rune after {voter.inferences} inferences '
+                      f'({voter.duplicates} repeated frames)')
+                return
+            print(f'Ran out of time after {voter.inferences} inferences, '
+                  f'entering the most confident frame')
+
+        for arrow in solution:
+            press(arrow, 1, down_time=0.1)
+        time.sleep(1)
+        for _ in range(3):
+            time.sleep(0.3)
+            gray = config.capture.frames.latest().gray
+            rune_buff = utils.multi_match(gray[:gray.shape[0] // 8, :],
+                                          RUNE_BUFF_TEMPLATE,
+                                          threshold=0.9)
+            if rune_buff:
+                rune_buff_pos = min(rune_buff, key=lambda p: p[0])
+                target = (
+                    round(rune_buff_pos[0] + config.capture.window['left']),
+                    round(rune_buff_pos[1] + config.capture.window['top'])
+                )
+                click(target, button='right')
+        self.rune_active = False
 
     def load_commands(self, file):
         """Prompts the user to select a command module to import. Updates config's command book."""
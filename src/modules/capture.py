@@ -2,15 +2,14 @@
 
 import time
 import cv2
-import threading
-import ctypes
-import mss
-import mss.windows
 import numpy as np
+import threading
 from src.common import config, utils
-from ctypes import wintypes
-user32 = ctypes.windll.user32
-user32.SetProcessDPIAware()
+from src.common.backends import ScreenBackend, ReplayBackend
+from src.common.frames import FrameBuffer, ChangeDetector
+from src.common.tracking import PlayerTracker, PositionEstimator
+from src.common.stats import LoopStats
+from src.common.recording import Recorder, RECORDING_FULL_FRAME_RATE
 
 
 # The distance between the top of the minimap and the top of the screen
@@ -34,33 +33,133 @@ MMT_WIDTH = max(MM_TL_TEMPLATE.shape[1], MM_BR_TEMPLATE.shape[1])
 PLAYER_TEMPLATE = cv2.imread('assets/player_template.png', 0)
 PT_HEIGHT, PT_WIDTH = PLAYER_TEMPLATE.shape
 
+# How many times per second to grab the entire window while only tracking the minimap
+FULL_FRAME_RATE = 10
+
+# How many frames per second to capture when no consumer needs a higher rate
+IDLE_FRAME_RATE = 2
+
+# How many pixels around a cached minimap corner to search when verifying a calibration
+CALIBRATION_MARGIN = 4
+
+# The minimum similarity a cached minimap corner must have to be reused
+CALIBRATION_THRESHOLD = 0.9
+
+# The maximum number of minimap calibrations to remember for each window position
+CALIBRATION_CACHE_SIZE = 8
+
+# How often (in seconds) to look for game windows that were opened, moved, or closed
+WINDOW_SEARCH_INTERVAL = 1
+
+
+class Client:
+    """The state that Capture tracks for a single MapleStory window."""
+
+    def __init__(self, handle=None):
+        """
+        Creates an uncalibrated Client.
+        :param handle:  The handle of the window this Client tracks.
+        """
+
+        self.handle = handle
+        self.rect = None
+        self.window = {
+            'left': 0,
+            'top': 0,
+            'width': 1366,
+            'height': 768
+        }
+
+        self.frames = FrameBuffer()
+        self.minimaps = FrameBuffer()
+        self.minimap = {}
+        self.minimap_ratio = 1
+        self.minimap_sample = None
+        self.minimap_bounds = None
+        self.minimap_region = None
+        self.player_pos = (0, 0)
+
+        self.tracker = PlayerTracker(PLAYER_TEMPLATE, threshold=0.8)
+        self.estimator = PositionEstimator()
+        self.frame_detector = ChangeDetector(stride=1)     # Consumers react to any change
+        self.minimap_detector = ChangeDetector(stride=2)
+
+        self.calibrated = False
+        self.last_full_frame = 0
+        self.display_state = None
+
+    def set_rect(self, rect):
+        """Moves this Client to a window at RECT, which requires a new calibration."""
+
+        self.rect = rect
+        self.window['left'] = rect[0]
+        self.window['top'] = rect[1]
+        self.window['width'] = max(rect[2] - rect[0], MMT_WIDTH)
+        self.window['height'] = max(rect[3] - rect[1], MMT_HEIGHT)
+        self.calibrated = False
+
+    @property
+    def frame(self):
+        """The image of the most recently grabbed game window, or None if none were grabbed."""
+
+        latest = self.frames.latest()
+        if latest is not None:
+            return latest.image
+
+    def predict_player_pos(self, lead=0):
+        """
+        Predicts where the player will be LEAD seconds from now based on their current velocity.
+        :param lead:    How many seconds ahead to predict.
+        :return:        The predicted position, or the last measured position if there is no estimate.
+        """
+
+        predicted = self.estimator.predict(time.perf_counter() + lead)
+        return self.player_pos if predicted is None else predicted
+
 
 class Capture:
     """
     A class that tracks player position and various in-game events. It constantly updates
     the config module with information regarding these events. It also annotates and
     displays the minimap in a pop-up window.
+
+    Every open MapleStory window is tracked by its own Client, and all of them are grabbed
+    on the same schedule. The first window that was found is the primary Client, whose
+    state is mirrored by this Capture's attributes and by config.player_pos.
     """
 
-    def __init__(self):
-        """Initializes this Capture object's main thread."""
+    def __init__(self, backend=None, minimap_only=True, full_frame_rate=FULL_FRAME_RATE,
+                 stats_interval=0, stats_path=None):
+        """
+        Initializes this Capture object's main thread.
+        :param backend:         The Backend to take screenshots with, defaults to the game window.
+        :param minimap_only:    Whether to only grab the minimap after calibration, and grab
+                                the entire window at FULL_FRAME_RATE instead of every iteration.
+        :param full_frame_rate: How many times per second to grab the entire window.
+        :param stats_interval:  How many seconds apart to report the capture loop's timings,
+                                or 0 to only collect them.
+        :param stats_path:      A CSV file to append the timings to instead of printing them.
+        """
 
         config.capture = self
 
-        self.frame = None
-        self.minimap = {}
-        self.minimap_ratio = 1
-        self.minimap_sample = None
-        self.sct = None
-        self.window = {
-            'left': 0,
-            'top': 0,
-            'width': 1366,
-            'height': 768
-        }
+        self.backend = ScreenBackend() if backend is None else backend
+        self.minimap_only = minimap_only
+        self.full_frame_rate = full_frame_rate
+        self.client = Client()
+        self.clients = {}
+        self.calibrations = {}
+        self.frame_count = 0
+        self.unchanged_count = 0
+        self.calibration_count = 0          # How many times the primary minimap was calibrated
+        self.stats = LoopStats('Capture', interval=stats_interval, path=stats_path)
+        self.recorder = None
+
+        self.demands = {}
+        self._demands_lock = threading.Lock()
+        self._wake = threading.Event()
 
         self.ready = False
-        self.calibrated = False
         self.thread = threading.Thread(target=self._main)
         self.thread.daemon = True
 
@@ -73,74 +172,415 @@ class Capture:
     def _main(self):
         """Constantly monitors the player's position and in-game events."""
 
-        mss.windows.CAPTUREBLT = 0
-        while True:
-            # Calibrate screen capture
-            handle = user32.FindWindowW(None, 'MapleStory')
-            rect = wintypes.RECT()
-            user32.GetWindowRect(handle, ctypes.pointer(rect))
-            rect = (rect.left, rect.top, rect.right, rect.bottom)
-            rect = tuple(max(0, x) for x in rect)
+        with self.backend:
+            last_search = None
+            while True:
+                self._wake.clear()
+                if not self.backend.advance():
+                    break
+
+                # Look for new windows, or for windows that moved and need recalibration
+                now = time.perf_counter()
+                self.stats.tick(now)
+                uncalibrated = any(not c.calibrated for c in self.clients.values())
+                if last_search is None or uncalibrated or now - last_search >= WINDOW_SEARCH_INTERVAL:
+                    self._update_clients(self.backend.find_windows())
+                    last_search = now
+
+                for client in list(self.clients.values()):
+                    if not client.calibrated:
+                        self._calibrate(client)
+                        if client.calibrated and client is self.client:
+                            self.calibration_count += 1
+                    elif self._update(client, now) and client is self.client:
+                        self.frame_count += 1
+                        if not self.ready:
+                            self.ready = True
+                self.stats.record('iteration', time.perf_counter() - now)
+
+                # Wait until the next frame is due, or until a consumer needs one sooner
+                delay = now + 1 / self.frame_rate() - time.perf_counter()
+                if delay > 0:
+                    self._wake.wait(delay)
+
+    def _update_clients(self, windows):
+        """
+        Creates a Client for every new window in WINDOWS and discards Clients whose
+        windows were closed. The primary Client adopts a new window if its own was closed.
+        :param windows:     A dictionary mapping window handles to their bounds.
+        :return:            None
+        """
+
+        for handle, rect in windows.items():
+            client = self.clients.get(handle)
+            if client is None:
+                if self.client.handle not in self.clients:
+                    client = self.client
+                    client.handle = handle
+                else:
+                    client = Client(handle)
+                self.clients[handle] = client
+            if rect != client.rect:
+                client.set_rect(rect)
 
-            self.window['left'] = rect[0]
-            self.window['top'] = rect[1]
-            self.window['width'] = max(rect[2] - rect[0], MMT_WIDTH)
-            self.window['height'] = max(rect[3] - rect[1], MMT_HEIGHT)
+        for handle in [h for h in self.clients if h not in windows]:
+            del self.clients[handle]
+        if self.client.handle not in self.clients and self.clients:
+            self.client = next(iter(self.clients.values()))
 
+    def _calibrate(self, client):
+        """Locates the minimap within CLIENT's window."""
+
+        # Reuse a previous calibration if the minimap has not moved
+        corners = self._recall_calibration(client)
+        if corners is None:
             # Calibrate by finding the bottom right corner of the minimap
-            with mss.mss() as self.sct:
-                self.frame = self.screenshot()
-            if self.frame is None:
-                continue
-            tl, _ = utils.single_match(self.frame, MM_TL_TEMPLATE)
-            _, br = utils.single_match(self.frame, MM_BR_TEMPLATE)
-            mm_tl = (
-                tl[0] + MINIMAP_BOTTOM_BORDER,
-                tl[1] + MINIMAP_TOP_BORDER
-            )
-            mm_br = (
-                max(mm_tl[0] + PT_WIDTH, br[0] - MINIMAP_BOTTOM_BORDER),
-                max(mm_tl[1] + PT_HEIGHT, br[1] - MINIMAP_BOTTOM_BORDER)
-            )
-            self.minimap_ratio = (mm_br[0] - mm_tl[0]) / (mm_br[1] - mm_tl[1])
-            self.minimap_sample = self.frame[mm_tl[1]:mm_br[1], mm_tl[0]:mm_br[0]]
-            self.calibrated = True
-
-            with mss.mss() as self.sct:
-                while True:
-                    if not self.calibrated:
-                        break
-
-                    # Take screenshot
-                    self.frame = self.screenshot()
-                    if self.frame is None:
-                        continue
-
-                    # Crop the frame to only show the minimap
-                    minimap = self.frame[mm_tl[1]:mm_br[1], mm_tl[0]:mm_br[0]]
-
-                    # Determine the player's position
-                    player = utils.multi_match(minimap, PLAYER_TEMPLATE, threshold=0.8)
-                    if player:
-                        config.player_pos = utils.convert_to_relative(player[0], minimap)
-
-                    # Package display information to be polled by GUI
-                    self.minimap = {
-                        'minimap': minimap,
-                        'rune_active': config.bot.rune_active,
-                        'rune_pos': config.bot.rune_pos,
-                        'path': config.path,
-                        'player_pos': config.player_pos
-                    }
-
-                    if not self.ready:
-                        self.ready = True
-                    time.sleep(0.001)
-
-    def screenshot(self, delay=1):
-        try:
-            return np.array(self.sct.grab(self.window))
-        except mss.exception.ScreenShotError:
-            print(f'\n[!] Error while taking screenshot, retrying in {delay} second'
-                  + ('s' if delay != 1 else ''))
-            time.sleep(delay)
+            published = self._grab_into(client.frames, client.window)
+            if published is None:
+                return
+            client.frames.publish(published)
+            tl, _ = utils.pyramid_single_match(published, MM_TL_TEMPLATE)
+            _, br = utils.pyramid_single_match(published, MM_BR_TEMPLATE)
+            corners = (tl, br)
+            self._remember_calibration(client.rect, corners)
+        tl, br = corners
+        mm_tl = (
+            tl[0] + MINIMAP_BOTTOM_BORDER,
+            tl[1] + MINIMAP_TOP_BORDER
+        )
+        mm_br = (
+            max(mm_tl[0] + PT_WIDTH, br[0] - MINIMAP_BOTTOM_BORDER),
+            max(mm_tl[1] + PT_HEIGHT, br[1] - MINIMAP_BOTTOM_BORDER)
+        )
+        minimap_region = {
+            'left': client.window['left'] + mm_tl[0],
+            'top': client.window['top'] + mm_tl[1],
+            'width': mm_br[0] - mm_tl[0],
+            'height': mm_br[1] - mm_tl[1]
+        }
+        minimap_sample = self.backend.grab(minimap_region)
+        if minimap_sample is None:
+            return
+
+        client.minimap_ratio = (mm_br[0] - mm_tl[0]) / (mm_br[1] - mm_tl[1])
+        client.minimap_sample = minimap_sample
+        client.minimap_bounds = (mm_tl, mm_br)
+        client.minimap_region = minimap_region
+        client.tracker.reset()
+        client.estimator.reset()
+        client.frame_detector.reset()
+        client.minimap_detector.reset()
+        client.last_full_frame = 0
+        client.display_state = None
+        client.calibrated = True
+
+    def _update(self, client, now):
+        """
+        Grabs CLIENT's minimap, and its entire window if it is due, and updates its player position.
+        :param client:  The Client to update.
+        :param now:     The time.perf_counter() value at the start of this iteration.
+        :return:        Whether the screenshots were taken successfully.
+        """
+
+        # Only grab the entire window when it is needed, which is only ever for the primary window
+        start = time.perf_counter()
+        if not self.minimap_only or (client is self.client and self.needs_frames()
+                                     and now - client.last_full_frame >= 1 / self.full_frame_rate):
+            frame = self._grab_into(client.frames, client.window)
+            if frame is None:
+                return False
+            if client.frame_detector.changed(frame.image):
+                client.frames.publish(frame)
+            client.last_full_frame = now
+
+        # Grab or crop the frame to only show the minimap
+        if self.minimap_only:
+            minimap = self._grab_into(client.minimaps, client.minimap_region)
+            if minimap is None:
+                return False
+            self.stats.record('grab', time.perf_counter() - start)
+        else:
+            grabbed = time.perf_counter()
+            self.stats.record('grab', grabbed - start)
+            mm_tl, mm_br = client.minimap_bounds
+            cropped = frame.image[mm_tl[1]:mm_br[1], mm_tl[0]:mm_br[0]]   # Even if unpublished
+            minimap = client.minimaps.acquire(cropped.shape, cropped.dtype)
+            np.copyto(minimap.image, cropped)
+            self.stats.record('crop', time.perf_counter() - grabbed)
+
+        # Unchanged minimaps are not published again, and the player has not moved
+        published = None
+        if client.minimap_detector.changed(minimap.image):
+            published = client.minimaps.publish(minimap)
+
+            # Determine the player's position
+            start = time.perf_counter()
+            player = client.tracker.locate(published.image)
+            if player is not None:
+                client.player_pos = utils.convert_to_relative(player, published.image,
+                                                              ratio=client.minimap_ratio)
+                client.estimator.update(client.player_pos, published.timestamp)
+                if client is self.client:
+                    config.player_pos = client.player_pos
+            else:
+                client.estimator.reset()
+            self.stats.record('match', time.perf_counter() - start)
+        else:
+            # The player is standing still, which the estimator must see to stop extrapolating
+            if client.estimator.position is not None:
+                client.estimator.update(client.player_pos, now)
+            self.unchanged_count += 1
+
+        # Save what the bot sees so that it can be replayed later
+        recorder = self.recorder
+        if recorder is not None and client is self.client:
+            recorder.add_frame(client.frames.latest())
+            if published is not None:
+                bot = config.bot
+                routine = config.routine
+                recorder.add_minimap(published, client.minimap_bounds[0], client.player_pos,
+                                     bot is not None and bot.rune_active,
+                                     -1 if routine is None else routine.index)
+
+        # Package display information to be polled by GUI
+        start = time.perf_counter()
+        bot = config.bot
+        rune = bot is not None and client is self.client
+        state = (
+            client.minimaps.seq,
+            rune and bot.rune_active,
+            bot.rune_pos if rune else (0, 0),
+            config.path if client is self.client else [],
+            client.player_pos
+        )
+        if state != client.display_state:
+            latest = client.minimaps.latest()
+            client.minimap = {
+                'minimap': latest.image,
+                'rune_active': state[1],
+                'rune_pos': state[2],
+                'path': state[3],
+                'player_pos': state[4],
+                'seq': latest.seq,
+                'timestamp': latest.timestamp
+            }
+            client.display_state = state
+        self.stats.record('publish', time.perf_counter() - start)
+        return True
+
+    def request_rate(self, name, rate, paused=False, frames=True):
+        """
+        Registers how many frames per second the consumer NAME needs. Capture runs at the
+        highest requested rate, or at IDLE_FRAME_RATE if no requests apply.
+        :param name:    A unique name for the consumer.
+        :param rate:    The number of frames per second needed, 0 to withdraw the request.
+        :param paused:  Whether the request also applies while Auto Maple is disabled.
+        :param frames:  Whether the consumer uses the entire window rather than only the minimap.
+        :return:        None
+        """
+
+        with self._demands_lock:
+            demands = self.demands.copy()
+            if rate > 0:
+                demands[name] = (rate, paused, frames)
+            else:
+                demands.pop(name, None)
+            self.demands = demands          # Replace rather than mutate for lock-free reads
+        self._wake.set()
+
+    def frame_rate(self):
+        """Returns the number of frames per second that Capture currently runs at."""
+
+        rates = [rate for rate, paused, _ in self.demands.values() if config.enabled or paused]
+        return max(rates + [IDLE_FRAME_RATE])
+
+    def needs_frames(self):
+        """
+        Returns whether the entire window should be grabbed at all while only tracking the
+        minimap, which is only the case while a recording or a consumer that uses it applies.
+        """
+
+        return self.recorder is not None \
+            or any(frames for _, paused, frames in self.demands.values()
+                   if config.enabled or paused)
+
+    def recalibrate(self):
+        """Requests a new calibration of every minimap without waiting for it to finish."""
+
+        for client in [self.client] + list(self.clients.values()):
+            client.calibrated = False
+        self._wake.set()
+
+    def _recall_calibration(self, client):
+        """
+        Checks whether any minimap previously found in a window at CLIENT's position is still
+        on screen by matching its corners within small regions around their cached positions.
+        :param client:  The Client to recalibrate.
+        :return:        The cached top-left and bottom-right corners, or None if none match.
+        """
+
+        cached = self.calibrations.get(client.rect, [])
+        for i, (tl, br) in enumerate(cached):
+            h, w = MM_BR_TEMPLATE.shape
+            if self._corner_matches(client, MM_TL_TEMPLATE, tl) \
+                    and self._corner_matches(client, MM_BR_TEMPLATE, (br[0] - w, br[1] - h)):
+                cached.insert(0, cached.pop(i))         # Most recently used goes first
+                return tl, br
+
+    def _remember_calibration(self, rect, corners):
+        """Caches the minimap CORNERS found within a window at RECT."""
+
+        cached = self.calibrations.setdefault(rect, [])
+        if corners in cached:
+            cached.remove(corners)
+        cached.insert(0, corners)
+        del cached[CALIBRATION_CACHE_SIZE:]
+
+    def _corner_matches(self, client, template, top_left):
+        """Returns whether TEMPLATE is in CLIENT's window with its top-left corner at TOP_LEFT."""
+
+        left = max(0, top_left[0] - CALIBRATION_MARGIN)
+        top = max(0, top_left[1] - CALIBRATION_MARGIN)
+        region = {
+            'left': client.window['left'] + left,
+            'top': client.window['top'] + top,
+            'width': template.shape[1] + 2 * CALIBRATION_MARGIN,
+            'height': template.shape[0] + 2 * CALIBRATION_MARGIN
+        }
+        roi = self.backend.grab(region)
+        if roi is None or roi.shape[0] < template.shape[0] or roi.shape[1] < template.shape[1]:
+            return False
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+        result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, location = cv2.minMaxLoc(result)
+        return score >= CALIBRATION_THRESHOLD \
+            and location == (top_left[0] - left, top_left[1] - top)
+
+    def start_recording(self, path, full_frame_rate=RECORDING_FULL_FRAME_RATE):
+        """
+        Starts recording the primary Client's minimaps and occasional full frames, along with
+        the player's position, whether a rune is active, and the routine's current index.
+        :param path:            The directory to write the recording into.
+        :param full_frame_rate: How many times per second to record the entire window.
+        :return:                The new Recorder.
+        """
+
+        self.stop_recording()
+        recorder = Recorder(path, full_frame_rate=full_frame_rate)
+        recorder.start()
+        self.recorder = recorder
+        return recorder
+
+    def stop_recording(self):
+        """Stops the current recording, if any, once all of its frames are written to disk."""
+
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.stop()
+
+    def _grab_into(self, buffer, region):
+        """
+        Grabs REGION straight into the next slot of BUFFER without publishing it.
+        :param buffer:  The FrameBuffer to write into.
+        :param region:  The region to grab.
+        :return:        The acquired Frame, or None if the screenshot could not be taken.
+        """
+
+        frame = buffer.acquire((region['height'], region['width'], 4))
+        if self.backend.grab(region, out=frame.image) is None:
+            return None
+        return frame
+
+    def predict_player_pos(self, lead=0):
+        """
+        Predicts where the player will be LEAD seconds from now based on their current velocity.
+        :param lead:    How many seconds ahead to predict.
+        :return:        The predicted position, or config.player_pos if there is no estimate.
+        """
+
+        return self.client.predict_player_pos(lead)
+
+    def screenshot(self, region=None):
+        """
+        Takes a screenshot using this Capture's Backend.
+        :param region:  The region to grab, defaults to the primary Client's entire window.
+        :return:        The screenshot as a BGRA Numpy array, or None if it could not be taken.
+        """
+
+        return self.backend.grab(self.window if region is None else region)
+
+    #################################
+    #       Primary Client State    #
+    #################################
+    @property
+    def calibrated(self):
+        return self.client.calibrated
+
+    @property
+    def window(self):
+        return self.client.window
+
+    @property
+    def frame(self):
+        return self.client.frame
+
+    @property
+    def frames(self):
+        return self.client.frames
+
+    @property
+    def minimaps(self):
+        return self.client.minimaps
+
+    @property
+    def minimap(self):
+        return self.client.minimap
+
+    @property
+    def minimap_ratio(self):
+        return self.client.minimap_ratio
+
+    @property
+    def minimap_sample(self):
+        return self.client.minimap_sample
+
+    @property
+    def tracker(self):
+        return self.client.tracker
+
+    @property
+    def estimator(self):
+        return self.client.estimator
+
+
+# Script for benchmarking the capture loop on a recording
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='a recording, a directory of images, a video file, or a .npy file')
+    parser.add_argument('--realtime', action='store_true', help='replay at the recorded speed')
+    parser.add_argument('--fps', type=float, default=30, help='the recorded frame rate')
+    parser.add_argument('--full-window', action='store_true',
+                        help='grab the entire window every iteration instead of only the minimap')
+    parser.add_argument('--stats-interval', type=float, default=0,
+                        help='how many seconds apart to report per-stage timings while running')
+    parser.add_argument('--stats-csv', help='a CSV file to append per-stage timings to')
+    parser.add_argument('--record', help='a directory to record the replayed frames into')
+    args = parser.parse_args()
+
+    capture = Capture(ReplayBackend(args.path, realtime=args.realtime, fps=args.fps),
+                      minimap_only=not args.full_window,
+                      stats_interval=args.stats_interval, stats_path=args.stats_csv)
+    capture.request_rate('benchmark', float('inf'), paused=True)
+    if args.record:
+        capture.start_recording(args.record)
+    start = time.perf_counter()
+    capture.start()
+    capture.thread.join()
+    elapsed = time.perf_counter() - start
+    capture.stop_recording()
+    print(f' ~  Processed {capture.frame_count} frames in {elapsed:.2f} seconds '
+          f'({capture.frame_count / elapsed:.1f} FPS)')
+    print(f' ~  Skipped {capture.unchanged_count} unchanged minimaps')
+    print(f' ~  Final player position: ({config.player_pos[0]:.3f}, {config.player_pos[1]:.3f})')
+    capture.stats.report()
@@ -10,6 +10,7 @@ from src.gui import Menu, View, Edit, Settings
 
 class GUI:
     DISPLAY_FRAME_RATE = 30
+    STATS_INTERVAL = 1
     RESOLUTIONS = {
         'DEFAULT': '800x800',
         'Edit': '1400x800'
@@ -40,6 +41,7 @@ class GUI:
 
         self.navigation.pack(expand=True, fill='both')
         self.navigation.bind('<<NotebookTabChanged>>', self._resize_window)
+        config.capture.request_rate('gui', GUI.DISPLAY_FRAME_RATE, paused=True, frames=False)
         self.root.focus()
 
     def set_routine(self, arr):
@@ -66,6 +68,11 @@ class GUI:
         curr_id = nav.select()
         nav.nametowidget(curr_id).focus()      # Focus the current Tab
         page = nav.tab(curr_id, 'text')
+
+        # Only keep capturing for the live minimap while it is visible
+        rate = GUI.DISPLAY_FRAME_RATE if page == 'View' else 0
+        config.capture.request_rate('gui', rate, paused=True, frames=False)
+
         if self.root.state() != 'zoomed':
             if page in GUI.RESOLUTIONS:
                 self.root.geometry(GUI.RESOLUTIONS[page])
@@ -87,8 +94,17 @@ class GUI:
 
     def _display_minimap(self):
         delay = 1 / GUI.DISPLAY_FRAME_RATE
+        last_stats = 0
+        calibrations = 0
         while True:
             self.view.minimap.display_minimap()
+            if config.capture.calibration_count != calibrations:
+                calibrations = config.capture.calibration_count
+                self.edit.minimap.redraw()
+            now = time.time()
+            if now - last_stats >= GUI.STATS_INTERVAL:
+                self.view.performance.update_stats()
+                last_stats = now
             time.sleep(delay)
 
     def _save_layout(self):
@@ -1,11 +1,13 @@
 """A keyboard listener to track user inputs."""
 
+import os
 import time
 import threading
 import winsound
 import keyboard as kb
 from src.common.interfaces import Configurable
 from src.common import config, utils
+from src.common.recording import RECORDINGS_DIR
 from datetime import datetime
 
 
@@ -13,7 +15,8 @@ class Listener(Configurable):
     DEFAULT_CONFIG = {
         'Start/stop': 'insert',
         'Reload routine': 'f6',
-        'Record position': 'f7'
+        'Record position': 'f7',
+        'Record frames': 'f8'
     }
     BLOCK_DELAY = 1         # Delay after blocking restricted button press
 
@@ -29,6 +32,10 @@ class Listener(Configurable):
         self.thread = threading.Thread(target=self._main)
         self.thread.daemon = True
 
+    def load_config(self):
+        super().load_config()
+        self.config = {**self.DEFAULT_CONFIG, **self.config}    # Fill in controls added later
+
     def start(self):
         """
         Starts listening to user inputs.
@@ -53,6 +60,8 @@ class Listener(Configurable):
                     Listener.reload_routine()
                 elif self.restricted_pressed('Record position'):
                     Listener.record_position()
+                elif kb.is_pressed(self.config['Record frames']):
+                    Listener.toggle_recording()
             time.sleep(0.01)
 
     def restricted_pressed(self, action):
@@ -97,10 +106,7 @@ class Listener(Configurable):
 
     @staticmethod
     def recalibrate_minimap():
-        config.capture.calibrated = False
-        while not config.capture.calibrated:
-            time.sleep(0.01)
-        config.gui.edit.minimap.redraw()
+        config.capture.recalibrate()        # The GUI redraws the minimap once it is calibrated
 
     @staticmethod
     def record_position():
@@ -109,3 +115,19 @@ class Listener(Configurable):
         config.gui.edit.record.add_entry(now, pos)
         print(f'\n[~] Recorded position ({pos[0]}, {pos[1]}) at {now}')
         time.sleep(0.6)
+
+    @staticmethod
+    def toggle_recording():
+        """
+        Starts recording what Capture sees into a new directory in RECORDINGS_DIR,
+        or stops the current recording. See ReplayBackend for replaying it.
+        """
+
+        if config.capture.recorder is None:
+            name = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+            config.capture.start_recording(os.path.join(RECORDINGS_DIR, name))
+            winsound.Beep(784, 200)     # G5
+        else:
+            config.capture.stop_recording()
+            winsound.Beep(523, 200)     # C5
+        time.sleep(0.6)
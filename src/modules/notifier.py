@@ -35,6 +35,7 @@ def get_alert_path(name):
 
 class Notifier:
     ALERTS_DIR = os.path.join('assets', 'alerts')
+    FRAME_RATE = 20
 
     def __init__(self):
         """Initializes this Notifier object's main thread."""
@@ -57,22 +58,38 @@ class Notifier:
 
     def _main(self):
         self.ready = True
+        config.capture.request_rate('notifier', Notifier.FRAME_RATE)
         prev_others = 0
+        prev_frames = None
+        prev_seq = 0
         rune_start_time = time.time()
         while True:
             if config.enabled:
-                frame = config.capture.frame
+                # A new primary window has its own FrameBuffer, which starts counting from 0
+                frames = config.capture.frames
+                if frames is not prev_frames:
+                    prev_frames = frames
+                    prev_seq = 0
+
+                # Only process frames that have not been processed yet
+                latest = frames.wait(prev_seq, timeout=1)
+                if latest is None:
+                    continue
+                prev_seq = latest.seq
+                frame = latest.image
                 height, width, _ = frame.shape
-                minimap = config.capture.minimap['minimap']
+                minimap = config.capture.minimaps.latest()
+                if minimap is None:         # The primary window changed and is calibrating
+                    continue
 
                 # Check for unexpected black screen
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                gray = latest.gray
                 if np.count_nonzero(gray < 15) / height / width > self.room_change_threshold:
                     self._alert('siren')
 
                 # Check for elite warning
-                elite_frame = frame[height // 4:3 * height // 4, width // 4:3 * width // 4]
-                elite = utils.multi_match(elite_frame, ELITE_TEMPLATE, threshold=0.9)
+                elite_frame = gray[height // 4:3 * height // 4, width // 4:3 * width // 4]
+                elite = utils.pyramid_multi_match(elite_frame, ELITE_TEMPLATE, threshold=0.9)
                 if len(elite) > 0:
                     self._alert('siren')
 
@@ -93,7 +110,7 @@ class Notifier:
                     rune_start_time = now
                     if matches and config.routine.sequence:
                         abs_rune_pos = (matches[0][0], matches[0][1])
-                        config.bot.rune_pos = utils.convert_to_relative(abs_rune_pos, minimap)
+                        config.bot.rune_pos = utils.convert_to_relative(abs_rune_pos, minimap.image)
                         distances = list(map(distance_to_rune, config.routine.sequence))
                         index = np.argmin(distances)
                         config.bot.rune_closest_pos = config.routine[index].location
@@ -6,6 +6,10 @@ from src.common import config, settings, utils
 from src.common.vkeys import key_down, key_up, press
 
 
+# How many seconds ahead to predict the player's position when deciding whether to stop moving
+PREDICTION_LEAD = 0.1
+
+
 #################################
 #       Routine Components      #
 #################################
@@ -247,13 +251,13 @@ class Move(Command):
         for i, point in enumerate(path):
             toggle = True
             self.prev_direction = ''
-            local_error = utils.distance(config.player_pos, point)
-            global_error = utils.distance(config.player_pos, self.target)
+            local_error = utils.distance(predicted_pos(), point)
+            global_error = utils.distance(predicted_pos(), self.target)
             while config.enabled and counter > 0 and \
                     local_error > settings.move_tolerance and \
                     global_error > settings.move_tolerance:
                 if toggle:
-                    d_x = point[0] - config.player_pos[0]
+                    d_x = point[0] - predicted_pos()[0]
                     if abs(d_x) > settings.move_tolerance / math.sqrt(2):
                         if d_x < 0:
                             key = 'left'
@@ -267,7 +271,7 @@ class Move(Command):
                         if i < len(path) - 1:
                             time.sleep(0.15)
                 else:
-                    d_y = point[1] - config.player_pos[1]
+                    d_y = point[1] - predicted_pos()[1]
                     if abs(d_y) > settings.move_tolerance / math.sqrt(2):
                         if d_y < 0:
                             key = 'up'
@@ -280,8 +284,8 @@ class Move(Command):
                         counter -= 1
                         if i < len(path) - 1:
                             time.sleep(0.05)
-                local_error = utils.distance(config.player_pos, point)
-                global_error = utils.distance(config.player_pos, self.target)
+                local_error = utils.distance(predicted_pos(), point)
+                global_error = utils.distance(predicted_pos(), self.target)
                 toggle = not toggle
             if self.prev_direction:
                 key_up(self.prev_direction)
@@ -296,6 +300,12 @@ class Adjust(Command):
         self.max_steps = settings.validate_nonnegative_int(max_steps)
 
 
+def predicted_pos():
+    """Returns where the player is expected to be by the time a new key press takes effect."""
+
+    return config.capture.predict_player_pos(PREDICTION_LEAD)
+
+
 def step(direction, target):
     """
     The default 'step' function. If not overridden, immediately stops the bot.
@@ -353,7 +363,7 @@ class Fall(Command):
         counter = 6
         while config.enabled and \
                 counter > 0 and \
-                utils.distance(start, config.player_pos) < self.distance:
+                utils.distance(start, predicted_pos()) < self.distance:
             press('space', 1, down_time=0.1)
             counter -= 1
         key_up('down')